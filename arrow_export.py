@@ -0,0 +1,322 @@
+"""
+Functions to export the occurrence and p-index tables of a CrimeData object to Apache Arrow
+and Parquet, and a small local HTTP server to read them back.
+
+Each table is written both as a Parquet dataset partitioned by year (one directory per year)
+and as a single Arrow IPC file. Crime types and neighbourhoods are dictionary-encoded. A
+downstream consumer only needs pyarrow to read them, for example without copying:
+
+    import pyarrow as pa
+    table = pa.ipc.open_file(pa.memory_map('export/pindex.arrow')).read_all()
+
+The tables can be exported and served from the command line:
+
+    python arrow_export.py --path ./crime_data_vancouver.csv --out ./export --serve
+
+The HTTP server streams Arrow record batches of the Parquet datasets, with filters on crime
+type and date range pushed down to the Parquet scan:
+
+    GET /occurrences?crime_type=Mischief&crime_type=Homicide&start=2020-01&end=2021-11
+    GET /pindex?start=2021-01
+"""
+import argparse
+import datetime
+import os
+import shutil
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import process_csv
+import time_axis
+from crime_data import CrimeData
+
+TABLES = ('occurrences', 'pindex')
+DICTIONARY_COLUMNS = ['crime_type', 'neighbourhood']
+ARROW_STREAM_TYPE = 'application/vnd.apache.arrow.stream'
+
+
+def occurrences_table(crime_data: CrimeData) -> pa.Table:
+    """
+    Return the occurrences of crime_data as an Arrow table with the columns crime_type,
+    neighbourhood (both dictionary-encoded), year, month, date (the first day of the month) and
+    count.
+
+    >>> data = CrimeData()
+    >>> data.increment_crime(('Mischief', 'Sunset', 2021, 11), 4)
+    >>> table = occurrences_table(data)
+    >>> table.column_names
+    ['crime_type', 'neighbourhood', 'year', 'month', 'date', 'count']
+    >>> table.to_pylist()[0]['date']
+    datetime.date(2021, 11, 1)
+    """
+    rows = [(crime_type, neighbourhood, year, month, count)
+            for crime_type, neighbourhoods in crime_data.crime_occurrences.items()
+            for neighbourhood, obj in neighbourhoods.items()
+            for year, months in obj.occurrences.items()
+            for month, count in months.items()]
+    return build_table(rows, 'count', pa.int32())
+
+
+def pindex_table(crime_data: CrimeData) -> pa.Table:
+    """
+    Return the p-indexes of crime_data as an Arrow table with the columns crime_type,
+    neighbourhood (both dictionary-encoded), year, month, date (the first day of the month),
+    p_index, and p_index_lower and p_index_upper, the bounds of the confidence interval of the
+    p-index from crime_data.crime_pindex_interval (NaN where no interval was computed).
+
+    >>> data = CrimeData()
+    >>> _ = [data.increment_crime(('Mischief', 'Sunset', year, month), 10 + (year + month) % 3) \
+    for year in range(2014, 2021) for month in range(1, 12 + 1)]
+    >>> data.create_pindex_data((2014, 2019), (2020, 2020))
+    >>> table = pindex_table(data)
+    >>> table.column_names[-3:]
+    ['p_index', 'p_index_lower', 'p_index_upper']
+    >>> set(table.column('p_index_lower').is_null(nan_is_null=True).to_pylist())
+    {True}
+    >>> data.create_pindex_intervals((2014, 2019), (2020, 2020), n_resamples=100)
+    >>> all(row['p_index_lower'] <= row['p_index_upper'] \
+    for row in pindex_table(data).to_pylist())
+    True
+    """
+    rows, bounds = [], []
+    for crime_type, neighbourhoods in crime_data.crime_pindex.items():
+        for neighbourhood, obj in neighbourhoods.items():
+            intervals = crime_data.crime_pindex_interval.get(crime_type, {}).get(neighbourhood,
+                                                                                 {})
+            for year, months in obj.p_index_dict.items():
+                for month, p_index in months.items():
+                    rows.append((crime_type, neighbourhood, year, month, p_index))
+                    bounds.append(intervals.get(year, {}).get(month, (np.nan, np.nan)))
+
+    lower, upper = ([list(column) for column in zip(*bounds)] if bounds else [[], []])
+    return build_table(rows, 'p_index', pa.float64()) \
+        .append_column('p_index_lower', pa.array(lower, pa.float64())) \
+        .append_column('p_index_upper', pa.array(upper, pa.float64()))
+
+
+def build_table(rows: list[tuple[str, str, int, int, float]], value_name: str,
+                value_type: pa.DataType) -> pa.Table:
+    """
+    Return an Arrow table of rows of the form (crime type, neighbourhood, year, month, value),
+    with the value column named value_name and of type value_type.
+    """
+    crime_types, neighbourhoods, years, months, values = \
+        ([list(column) for column in zip(*rows)] if rows else [[], [], [], [], []])
+    years = np.array(years, dtype=np.int32)
+    months = np.array(months, dtype=np.int32)
+
+    # months since 1970-01 are exactly the numpy representation of datetime64[M]
+    month_indexes = time_axis.month_index(years, months) - time_axis.month_index(1970, 1)
+    dates = month_indexes.astype('datetime64[M]').astype('datetime64[D]')
+
+    return pa.table({
+        'crime_type': pa.array(crime_types, pa.string()).dictionary_encode(),
+        'neighbourhood': pa.array(neighbourhoods, pa.string()).dictionary_encode(),
+        'year': pa.array(years, pa.int16()),
+        'month': pa.array(months, pa.int8()),
+        'date': pa.array(dates, pa.date32()),
+        value_name: pa.array(values, value_type)})
+
+
+def export_tables(crime_data: CrimeData, out_dir: str) -> None:
+    """
+    Write the occurrence and p-index tables of crime_data to out_dir, each as a Parquet
+    dataset partitioned by year (out_dir/occurrences/ and out_dir/pindex/) and as an Arrow IPC
+    file (out_dir/occurrences.arrow and out_dir/pindex.arrow). Existing exports are replaced,
+    including the year partitions that the new tables have no rows for.
+
+    >>> import tempfile
+    >>> out_dir = tempfile.mkdtemp()
+    >>> data = CrimeData()
+    >>> data.increment_crime(('Mischief', 'Sunset', 2003, 1), 2)
+    >>> data.increment_crime(('Mischief', 'Sunset', 2021, 11), 4)
+    >>> export_tables(data, out_dir)
+    >>> sorted(open_dataset(out_dir, 'occurrences').to_table().column('year').to_pylist())
+    [2003, 2021]
+    >>> data = CrimeData()
+    >>> data.increment_crime(('Mischief', 'Sunset', 2021, 11), 4)
+    >>> export_tables(data, out_dir)
+    >>> open_dataset(out_dir, 'occurrences').to_table().column('year').to_pylist()
+    [2021]
+    >>> sorted(os.listdir(os.path.join(out_dir, 'occurrences')))
+    ['year=2021']
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    for name, table in zip(TABLES, (occurrences_table(crime_data), pindex_table(crime_data))):
+        # remove the whole previous dataset, since writing only replaces the partitions written
+        shutil.rmtree(os.path.join(out_dir, name), ignore_errors=True)
+        ds.write_dataset(table, os.path.join(out_dir, name), format='parquet',
+                         partitioning=ds.partitioning(pa.schema([('year', pa.int16())]),
+                                                      flavor='hive'),
+                         existing_data_behavior='delete_matching')
+
+        with pa.OSFile(os.path.join(out_dir, f'{name}.arrow'), 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+
+def open_dataset(out_dir: str, name: str) -> ds.Dataset:
+    """
+    Return the Parquet dataset of the table name exported to out_dir, reading the crime type and
+    neighbourhood columns as dictionaries.
+
+    Preconditions:
+        - name in TABLES
+    """
+    parquet_format = ds.ParquetFileFormat(read_options={'dictionary_columns':
+                                                        DICTIONARY_COLUMNS})
+    return ds.dataset(os.path.join(out_dir, name), format=parquet_format,
+                      partitioning=ds.partitioning(pa.schema([('year', pa.int16())]),
+                                                   flavor='hive'))
+
+
+def build_filter(crime_types: list[str], start_year_month: Optional[tuple[int, int]],
+                 end_year_month: Optional[tuple[int, int]]) -> Optional[ds.Expression]:
+    """
+    Return the dataset filter keeping the rows of the given crime types (all crime types if
+    crime_types is empty) from start_year_month to end_year_month inclusive (unbounded when
+    None). Return None if nothing is filtered.
+
+    The year is also filtered, so that Parquet partitions outside the range are not read.
+    """
+    conditions = []
+    if crime_types:
+        conditions.append(ds.field('crime_type').isin(crime_types))
+    if start_year_month is not None:
+        conditions.append(ds.field('year') >= start_year_month[0])
+        conditions.append(ds.field('date') >= datetime.date(*start_year_month, 1))
+    if end_year_month is not None:
+        conditions.append(ds.field('year') <= end_year_month[0])
+        conditions.append(ds.field('date') <= datetime.date(*end_year_month, 1))
+
+    if not conditions:
+        return None
+    expression = conditions[0]
+    for condition in conditions[1:]:
+        expression = expression & condition
+    return expression
+
+
+def make_handler(out_dir: str) -> type:
+    """
+    Return a request handler class that streams the tables exported to out_dir.
+    """
+
+    class ArrowRequestHandler(BaseHTTPRequestHandler):
+        """Streams the exported tables as Arrow IPC streams of record batches.
+
+        GET /<table>?crime_type=<crime type>&start=<YYYY-MM>&end=<YYYY-MM>, where table is one
+        of TABLES and every query parameter is optional (crime_type may be repeated).
+        """
+
+        def do_GET(self) -> None:
+            """Respond to a GET request with the filtered record batches of a table."""
+            url = urlparse(self.path)
+            name = url.path.strip('/')
+            if name not in TABLES:
+                self.send_error(404, f'Unknown table; expected one of {", ".join(TABLES)}')
+                return
+
+            query = parse_qs(url.query)
+            try:
+                start = time_axis.parse_year_month(query['start'][0]) \
+                    if 'start' in query else None
+                end = time_axis.parse_year_month(query['end'][0]) if 'end' in query else None
+                expression = build_filter(query.get('crime_type', []), start, end)
+            except ValueError:
+                self.send_error(400, "start and end must be months written as 'YYYY-MM'")
+                return
+
+            try:
+                dataset = open_dataset(out_dir, name)
+            except FileNotFoundError:
+                dataset = None
+            if dataset is None or not dataset.files:
+                self.send_error(404, f'The {name} table has not been exported')
+                return
+            scanner = dataset.scanner(filter=expression)
+
+            self.send_response(200)
+            self.send_header('Content-Type', ARROW_STREAM_TYPE)
+            self.end_headers()
+
+            # write each record batch as soon as it is read, without collecting the table
+            with pa.ipc.new_stream(self.wfile, scanner.projected_schema) as writer:
+                for batch in scanner.to_batches():
+                    writer.write_batch(batch)
+
+    return ArrowRequestHandler
+
+
+def serve(out_dir: str, host: str = '127.0.0.1', port: int = 8051) -> ThreadingHTTPServer:
+    """
+    Return a local HTTP server (not yet started) streaming the tables exported to out_dir.
+    Call serve_forever on it to start it.
+
+    Unknown tables and tables that have not been exported get a 404 response, and dates that
+    are not months written as 'YYYY-MM' get a 400 response.
+
+    >>> import tempfile, threading, urllib.error, urllib.request
+    >>> out_dir = tempfile.mkdtemp()
+    >>> server = serve(out_dir, port=0)
+    >>> server.RequestHandlerClass.log_message = lambda *args: None
+    >>> threading.Thread(target=server.serve_forever, daemon=True).start()
+    >>> host, port = server.server_address
+    >>> def get_status(path: str) -> int:
+    ...     try:
+    ...         with urllib.request.urlopen(f'http://{host}:{port}{path}') as response:
+    ...             response.read()
+    ...             return response.status
+    ...     except urllib.error.HTTPError as error:
+    ...         return error.code
+    >>> get_status('/occurrences')
+    404
+    >>> data = CrimeData()
+    >>> data.increment_crime(('Mischief', 'Sunset', 2021, 11), 4)
+    >>> export_tables(data, out_dir)
+    >>> get_status('/occurrences?start=2021-11'), get_status('/occurrences?start=2021-13')
+    (200, 400)
+    >>> get_status('/occurrences?end=November'), get_status('/homicides')
+    (400, 404)
+    >>> server.shutdown()
+    >>> server.server_close()
+    """
+    return ThreadingHTTPServer((host, port), make_handler(out_dir))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export the occurrence and p-index tables to '
+                                                 'Parquet and Arrow, and optionally serve them.')
+    parser.add_argument('--path', default='./crime_data_vancouver.csv',
+                        help='processed CSV built by process_csv.create_csv')
+    parser.add_argument('--out', default='./export', help='directory to export the tables to')
+    parser.add_argument('--fit-range', nargs=2, type=int, default=(2014, 2019),
+                        metavar=('START_YEAR', 'END_YEAR'),
+                        help='range of years used to fit the model')
+    parser.add_argument('--predict-range', nargs=2, type=int, default=(2020, 2021),
+                        metavar=('START_YEAR', 'END_YEAR'),
+                        help='range of years to compute p-indexes for')
+    parser.add_argument('--intervals', action='store_true',
+                        help='also compute bootstrap confidence intervals of the p-indexes')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='number of worker processes used to compute the intervals')
+    parser.add_argument('--serve', action='store_true',
+                        help='serve the exported tables over HTTP after exporting them')
+    parser.add_argument('--port', type=int, default=8051, help='port of the HTTP server')
+    args = parser.parse_args()
+
+    data = process_csv.get_vancouver_data(args.path, start_year_month=(2003, 1),
+                                          end_year_month=(2021, 11))
+    data.create_pindex_data(tuple(args.fit_range), tuple(args.predict_range))
+    if args.intervals:
+        data.create_pindex_intervals(tuple(args.fit_range), tuple(args.predict_range),
+                                     processes=args.processes)
+    export_tables(data, args.out)
+
+    if args.serve:
+        server = serve(args.out, port=args.port)
+        print(f'Serving {", ".join(TABLES)} on http://127.0.0.1:{args.port}/')
+        server.serve_forever()
@@ -0,0 +1,199 @@
+"""
+A rolling-origin backtest of the p-index model of NeighbourhoodCrimePIndex.
+
+The (fit range, predict range) window is slid across the years before the pandemic, and for
+every window the same per-month linear model is fit and used to compute the p-indexes of the
+years that follow it. Since those years are ordinary years, the fraction of p-indexes beyond a
+threshold is the false-alarm rate of the model, which can be compared to the rate the model
+expects.
+
+Every window is fit in O(1) per series from cumulative sums over the years, and all series and
+windows are computed as batched array operations, optionally split across processes.
+
+Usage:
+    python backtest.py --years 2003 2019 --fit-length 6 --horizon 2
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import process_csv
+from crime_data import CrimeData
+from stat_analysis import gen_pindex_array
+
+# number of (crime, neighbourhood, month) series backtested together in one batch
+BACKTEST_BATCH_SIZE = 4096
+
+
+def backtest_pindex_array(occurrences: np.ndarray, fit_length: int,
+                          horizon: int) -> np.ndarray:
+    """
+    Return the p-index of every prediction of every rolling window of every series.
+
+    occurrences has one row per series and one column per consecutive year (NaN where data is
+    missing). Window w is fit to the years w to w + fit_length - 1 and predicts the years
+    w + fit_length to w + fit_length + horizon - 1. The result has shape
+    (series, windows, horizon); predictions whose window or observation has missing data are
+    NaN.
+
+    Preconditions:
+        - fit_length >= 2
+        - horizon >= 1
+        - occurrences.shape[1] >= fit_length + horizon
+
+    >>> series = np.array([[10.0, 12.0, 9.0, 14.0, 12.0, 15.0, 30.0, 13.0]])
+    >>> pindexes = backtest_pindex_array(series, 6, 1)
+    >>> pindexes.shape
+    (1, 2, 1)
+    >>> from stat_analysis import gen_linear_regression, gen_rmsd
+    >>> data = list(enumerate(series[0, :6]))
+    >>> model = gen_linear_regression(data)
+    >>> expected = gen_pindex_array(np.array(30.0), model.predict([[6]])[0], \
+    np.array(gen_rmsd(data, model)))
+    >>> bool(np.isclose(pindexes[0, 0, 0], expected))
+    True
+    """
+    n_series, n_years = occurrences.shape
+    n_windows = n_years - fit_length - horizon + 1
+    years = np.arange(n_years, dtype=float)
+
+    # cumulative sums over the years, with a leading zero so that a window is a difference
+    valid = ~np.isnan(occurrences)
+    values = np.where(valid, occurrences, 0.0)
+    zero = np.zeros((n_series, 1))
+    sum_y = np.concatenate([zero, np.cumsum(values, axis=1)], axis=1)
+    sum_ty = np.concatenate([zero, np.cumsum(values * years, axis=1)], axis=1)
+    sum_yy = np.concatenate([zero, np.cumsum(values ** 2, axis=1)], axis=1)
+    count = np.concatenate([zero, np.cumsum(valid, axis=1)], axis=1)
+
+    starts = np.arange(n_windows)
+    ends = starts + fit_length
+
+    # sums of each window: shape (series, windows)
+    window_y = sum_y[:, ends] - sum_y[:, starts]
+    window_ty = sum_ty[:, ends] - sum_ty[:, starts]
+    window_yy = sum_yy[:, ends] - sum_yy[:, starts]
+    complete = (count[:, ends] - count[:, starts]) == fit_length
+
+    # sums of the years of each window do not depend on the series: shape (windows,)
+    window_t = fit_length * starts + fit_length * (fit_length - 1) / 2
+    window_tt = np.cumsum(np.concatenate([[0.0], years ** 2]))[ends] \
+        - np.cumsum(np.concatenate([[0.0], years ** 2]))[starts]
+
+    # least squares line and root mean squared deviation of each window
+    mean_t = window_t / fit_length
+    mean_y = window_y / fit_length
+    variance_t = window_tt - fit_length * mean_t ** 2
+    covariance = window_ty - fit_length * mean_t * mean_y
+    slopes = covariance / variance_t
+    intercepts = mean_y - slopes * mean_t
+    squared_error = window_yy - fit_length * mean_y ** 2 - slopes * covariance
+    rmsd = np.sqrt(np.maximum(squared_error, 0.0) / fit_length)
+
+    # observations and predictions of the years following each window: shape (series, windows,
+    # horizon)
+    predict_years = ends[:, np.newaxis] + np.arange(horizon)
+    observations = occurrences[:, predict_years]
+    predictions = intercepts[..., np.newaxis] + slopes[..., np.newaxis] * predict_years
+
+    pindexes = gen_pindex_array(observations, predictions, rmsd[..., np.newaxis])
+    return np.where(complete[..., np.newaxis] & ~np.isnan(observations), pindexes, np.nan)
+
+
+def run_backtest(crime_data: CrimeData, years: tuple[int, int], fit_length: int,
+                 horizon: int, threshold: float = 95.0, processes: int = 1) -> pd.DataFrame:
+    """
+    Backtest the p-index model on the occurrences of crime_data from years[0] to years[1]
+    inclusive and return the calibration of every crime type and neighbourhood as a dataframe
+    with the columns:
+
+        - 'crime_type' and 'neighbourhood'
+        - 'predictions': the number of p-indexes computed over all windows and months
+        - 'alarms': the number of those p-indexes whose absolute value is beyond threshold
+        - 'alarm_rate': alarms / predictions, the false-alarm rate
+        - 'expected_rate': the alarm rate expected by the model, 1 - threshold / 100
+        - 'mean_abs_pindex': the mean absolute p-index
+
+    The (crime, neighbourhood, month) series are split into batches of a fixed size, computed
+    using up to processes worker processes.
+
+    Preconditions:
+        - fit_length >= 2
+        - horizon >= 1
+        - years[1] - years[0] + 1 >= fit_length + horizon
+        - 0 <= threshold < 100
+        - processes >= 1
+    """
+    keys, array = crime_data.occurrence_array(years)
+
+    # one series per (crime, neighbourhood, month): shape (len(keys) * 12, years)
+    series = array.transpose(0, 2, 1).reshape(len(keys) * 12, -1)
+    batches = [series[start:start + BACKTEST_BATCH_SIZE]
+               for start in range(0, len(series), BACKTEST_BATCH_SIZE)]
+
+    if processes == 1 or len(batches) <= 1:
+        results = [backtest_pindex_array(batch, fit_length, horizon) for batch in batches]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            results = list(executor.map(backtest_pindex_array, batches,
+                                        [fit_length] * len(batches), [horizon] * len(batches)))
+
+    if results:
+        pindexes = np.concatenate(results).reshape(len(keys), -1)
+    else:
+        pindexes = np.empty((0, 0))
+    computed = ~np.isnan(pindexes)
+    predictions = computed.sum(axis=1)
+    alarms = (np.abs(np.where(computed, pindexes, 0.0)) > threshold).sum(axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return pd.DataFrame({
+            'crime_type': [key[0] for key in keys],
+            'neighbourhood': [key[1] for key in keys],
+            'predictions': predictions,
+            'alarms': alarms,
+            'alarm_rate': alarms / predictions,
+            'expected_rate': 1 - threshold / 100,
+            'mean_abs_pindex': np.nanmean(np.abs(pindexes), axis=1)
+            if pindexes.size else np.zeros(len(keys))})
+
+
+def summarize_by_crime_type(calibration: pd.DataFrame) -> pd.DataFrame:
+    """
+    Return the calibration of every crime type, pooling the neighbourhoods of calibration,
+    a dataframe returned by run_backtest.
+    """
+    summary = calibration.groupby('crime_type', as_index=False)[['predictions', 'alarms']].sum()
+    summary['alarm_rate'] = summary['alarms'] / summary['predictions']
+    summary['expected_rate'] = calibration['expected_rate'].iloc[0] if len(calibration) else 0.0
+    return summary.sort_values('alarm_rate', ascending=False, ignore_index=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Backtest the p-index model with rolling '
+                                                 'windows and report its false-alarm rate.')
+    parser.add_argument('--path', default='./crime_data_vancouver.csv',
+                        help='processed CSV built by process_csv.create_csv')
+    parser.add_argument('--years', nargs=2, type=int, default=(2003, 2019),
+                        metavar=('START_YEAR', 'END_YEAR'),
+                        help='years the windows are slid across')
+    parser.add_argument('--fit-length', type=int, default=6,
+                        help='number of years used to fit the model in each window')
+    parser.add_argument('--horizon', type=int, default=2,
+                        help='number of years predicted after each window')
+    parser.add_argument('--threshold', type=float, default=95.0,
+                        help='|p-index| beyond which a prediction is an alarm')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='number of worker processes')
+    parser.add_argument('--output', default=None,
+                        help='CSV file to write the per-neighbourhood calibration to')
+    args = parser.parse_args()
+
+    data = process_csv.get_vancouver_data(args.path, start_year_month=(args.years[0], 1),
+                                          end_year_month=(args.years[1], 12))
+    results = run_backtest(data, tuple(args.years), args.fit_length, args.horizon,
+                           args.threshold, args.processes)
+
+    print(summarize_by_crime_type(results).to_string(index=False))
+    if args.output is not None:
+        results.to_csv(args.output, index=False)
@@ -4,9 +4,19 @@ and pindex data for the data visualization and analysis.
 
 Daniel Dervishi, David De Martin, Martin Calcaterra
 """
-import datetime
-from dateutil import relativedelta
-from neighbourhood_crime import NeighbourhoodCrimePIndex, NeighbourhoodCrimeOccurrences
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator
+import numpy as np
+from scipy import sparse
+import time_axis
+from neighbourhood_crime import NeighbourhoodCrimePIndex, NeighbourhoodCrimeOccurrences, \
+    NeighbourhoodCrimePooledPIndex, gen_month_pindex, value_in_dict
+from stat_analysis import gen_batch_linear_regression, gen_bootstrap_pindex_bounds, \
+    gen_masked_linear_regression, gen_pindex_array
+
+# number of (crime, neighbourhood, month) series bootstrapped together in one batch
+INTERVAL_BATCH_SIZE = 256
 
 
 class CrimeData:
@@ -16,19 +26,29 @@ class CrimeData:
         - crime_occurrences: dict mapping crime type to dict of neighbourhood crime occurrences
         objects.
         - crime_pindex: dict mapping crime type to dict of neighbourhood crime p-index objects.
+        - crime_pindex_interval: dict mapping crime type to dict of neighbourhood to dict of
+        years which map to dicts of months which map to the (lower, upper) bounds of the
+        confidence interval of the p-index of this month.
+        - crime_pindex_smoothed: dict mapping crime type to dict of neighbourhood crime p-index
+        objects computed from the occurrences of each neighbourhood and its neighbours.
     """
 
     crime_occurrences: dict[str, dict[str, NeighbourhoodCrimeOccurrences]]
     crime_pindex: dict[str, dict[str, NeighbourhoodCrimePIndex]]
+    crime_pindex_interval: dict[str, dict[str, dict[int, dict[int, tuple[float, float]]]]]
+    crime_pindex_smoothed: dict[str, dict[str, NeighbourhoodCrimePooledPIndex]]
 
     def __init__(self) -> None:
         """
-        Initializes the CrimeData object with attributes crime_occurrences: empty dict and
-        crime_pindex: empty dict.
+        Initializes the CrimeData object with attributes crime_occurrences: empty dict,
+        crime_pindex: empty dict, crime_pindex_interval: empty dict and crime_pindex_smoothed:
+        empty dict.
         """
 
         self.crime_occurrences = {}
         self.crime_pindex = {}
+        self.crime_pindex_interval = {}
+        self.crime_pindex_smoothed = {}
 
     def increment_crime(self, observation: tuple[str, str, int, int], occurrences: int) -> None:
         """Increments the number of crime occurrences of a specific type in a specific neighbourhood
@@ -69,8 +89,7 @@ class CrimeData:
         dictionary at each of these years and months set to zero.
 
         Preconditions:
-            - datetime.date(year=start_year_month[0], month=start_year_month[1], day=1) < \
-        datetime.date(year=end_year_month[0], month=end_year_month[1], day=1)
+            - time_axis.month_index(*start_year_month) < time_axis.month_index(*end_year_month)
 
         Only fill gaps that are within the timeframe the data was collected. Only
         (2003, 01) - (2021, 11) can be filled in our case.
@@ -85,6 +104,11 @@ class CrimeData:
         """
         Creates all the data that goes into the p-index dict.
 
+        The occurrences are laid out on the month axis by occurrence_array, and the model of
+        NeighbourhoodCrimePIndex (one line per crime, neighbourhood and month, fit to the years
+        of fit_range that have data) is fit and evaluated for all of them at once with batched
+        array operations.
+
         Preconditions:
             - fit_range[1] < predict_range[0]
 
@@ -93,15 +117,262 @@ class CrimeData:
 
         For all crimes and neighbourhoods as well as all months within predict_range in the
         occurrences data must contain entries.
+
+        >>> data = CrimeData()
+        >>> _ = [data.increment_crime(('Mischief', 'Sunset', year, month), (year * month) % 7) \
+        for year in range(2014, 2022) for month in range(1, 12 + 1)]
+        >>> data.create_pindex_data((2014, 2019), (2020, 2021))
+        >>> expected = NeighbourhoodCrimePIndex(('Sunset', 'Mischief'), \
+        data.crime_occurrences['Mischief']['Sunset'], (2014, 2019), (2020, 2021))
+        >>> p_index_dict = data.crime_pindex['Mischief']['Sunset'].p_index_dict
+        >>> all(np.isclose(p_index_dict[year][month], expected.p_index_dict[year][month]) \
+        for year in (2020, 2021) for month in range(1, 12 + 1))
+        True
+        """
+        keys, array = self.occurrence_array((fit_range[0], predict_range[1]))
+        n_fit = fit_range[1] - fit_range[0] + 1
+        fit_years = np.arange(fit_range[0], fit_range[1] + 1)
+        predict_years = np.arange(predict_range[0], predict_range[1] + 1)
+
+        # one series per (crime, neighbourhood, month): shape (len(keys) * 12, years)
+        series = array.transpose(0, 2, 1).reshape(len(keys) * 12, -1)
+        predict_occurrences = series[:, -len(predict_years):]
+
+        slopes, intercepts, rmsd = gen_masked_linear_regression(fit_years, series[:, :n_fit])
+        predictions = intercepts[:, np.newaxis] + slopes[:, np.newaxis] * predict_years
+        pindexes = gen_pindex_array(predict_occurrences, predictions, rmsd[:, np.newaxis]) \
+            .reshape(len(keys), 12, -1)
+
+        for row, (crime_type, neighbourhood) in enumerate(keys):
+            p_index_dict = {}
+            for year_index, year in enumerate(predict_years.tolist()):
+                for month in range(1, 12 + 1):
+                    if not np.isnan(pindexes[row, month - 1, year_index]):
+                        value_in_dict(year, p_index_dict)
+                        p_index_dict[year][month] = float(pindexes[row, month - 1, year_index])
+
+            if crime_type not in self.crime_pindex:
+                self.crime_pindex[crime_type] = {}
+            self.crime_pindex[crime_type][neighbourhood] = \
+                NeighbourhoodCrimePIndex.from_p_index_dict((neighbourhood, crime_type),
+                                                           p_index_dict)
+
+    def iter_month_pindex(self, fit_range: tuple[int, int], year_month: tuple[int, int]) \
+            -> Iterator[tuple[str, str, float]]:
+        """
+        Yield (crime type, neighbourhood, p-index) for the single year and month year_month,
+        one neighbourhood at a time, without building or storing any p-index objects.
+
+        Neighbourhoods that have no occurrences entry for year_month are skipped.
+
+        Preconditions:
+            - fit_range[1] < year_month[0]
+
+        Each crime and neighbourhood contains contiguous occurrences data from the beginning of the
+        fit range to the end of the fit range inclusive.
         """
+        year, month = year_month
         for crime_type in self.crime_occurrences:
-            for neighbourhood in self.crime_occurrences[crime_type]:
-                if crime_type not in self.crime_pindex:
-                    self.crime_pindex[crime_type] = {}
-                self.crime_pindex[crime_type][neighbourhood] = \
-                    NeighbourhoodCrimePIndex((neighbourhood, crime_type),
-                                             self.crime_occurrences[crime_type][neighbourhood],
-                                             fit_range, predict_range)
+            for neighbourhood, occurrences in self.crime_occurrences[crime_type].items():
+                if month in occurrences.occurrences.get(year, {}):
+                    yield crime_type, neighbourhood, \
+                        gen_month_pindex(occurrences, fit_range, year_month)
+
+    def occurrence_array(self, years: tuple[int, int]) \
+            -> tuple[list[tuple[str, str]], np.ndarray]:
+        """
+        Return the (crime type, neighbourhood) of every neighbourhood crime occurrences object
+        together with an array of shape (number of objects, number of years, 12) holding their
+        occurrences from years[0] to years[1] inclusive, one row per object in the same order.
+        Months without an entry are NaN.
+
+        Preconditions:
+            - years[0] <= years[1]
+
+        >>> data = CrimeData()
+        >>> data.increment_crime(('Mischief', 'Sunset', 2003, 2), 4)
+        >>> keys, array = data.occurrence_array((2003, 2004))
+        >>> keys
+        [('Mischief', 'Sunset')]
+        >>> array.shape
+        (1, 2, 12)
+        >>> array[0, 0, 1] == 4 and np.isnan(array[0, 1, 1])
+        True
+        """
+        keys = [(crime_type, neighbourhood) for crime_type in self.crime_occurrences
+                for neighbourhood in self.crime_occurrences[crime_type]]
+        first_index = time_axis.month_index(years[0], 1)
+        array = np.full((len(keys), (years[1] - years[0] + 1) * 12), np.nan)
+
+        for row, (crime_type, neighbourhood) in enumerate(keys):
+            occurrences = self.crime_occurrences[crime_type][neighbourhood].occurrences
+            for year in range(years[0], years[1] + 1):
+                for month, count in occurrences.get(year, {}).items():
+                    array[row, time_axis.month_index(year, month) - first_index] = count
+
+        # consecutive month indexes starting in January split evenly into years of 12 months
+        return keys, array.reshape(len(keys), -1, 12)
+
+    def create_pindex_intervals(self, fit_range: tuple[int, int], predict_range: tuple[int, int],
+                                n_resamples: int = 2000, confidence: float = 0.95,
+                                seed: int = 0, processes: int = 1) -> None:
+        """
+        Creates all the data that goes into the p-index interval dict: a bootstrap confidence
+        interval for every p-index of the model used by create_pindex_data.
+
+        The (crime, neighbourhood, month) series are split into batches of a fixed size that are
+        computed with batched array operations. With processes > 1, the batches are split into
+        one contiguous group per worker process (at most one per CPU), so each worker is started
+        and sent its data only once. Each batch is seeded from seed and its position, so the
+        intervals do not depend on the number of processes.
+
+        Preconditions:
+            - fit_range[1] < predict_range[0]
+            - n_resamples >= 1
+            - 0 < confidence < 1
+            - processes >= 1
+
+        Each crime and neighbourhood contains contiguous occurrences data from the beginning of the
+        fit range to the end of the fit range inclusive.
+        """
+        keys, array = self.occurrence_array((fit_range[0], predict_range[1]))
+        n_fit = fit_range[1] - fit_range[0] + 1
+        fit_years = np.arange(fit_range[0], fit_range[1] + 1)
+        predict_years = np.arange(predict_range[0], predict_range[1] + 1)
+
+        # one series per (crime, neighbourhood, month): shape (len(keys) * 12, years)
+        series = array.transpose(0, 2, 1).reshape(len(keys) * 12, -1)
+        fit_occurrences = series[:, :n_fit]
+        predict_occurrences = series[:, -len(predict_years):]
+
+        # keep the memory of a batch at about n_resamples * BATCH_SIZE * n_fit floats
+        starts = range(0, len(series), INTERVAL_BATCH_SIZE)
+        batches = [((fit_years, fit_occurrences[start:start + INTERVAL_BATCH_SIZE]),
+                    (predict_years, predict_occurrences[start:start + INTERVAL_BATCH_SIZE]),
+                    n_resamples, confidence, (seed, index))
+                   for index, start in enumerate(starts)]
+
+        workers = min(processes, os.cpu_count() or 1, len(batches))
+        if workers <= 1:
+            results = gen_bootstrap_batches(batches)
+        else:
+            group_size = -(-len(batches) // workers)
+            groups = [batches[start:start + group_size]
+                      for start in range(0, len(batches), group_size)]
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = [result for group_results in executor.map(gen_bootstrap_batches, groups)
+                           for result in group_results]
+
+        if not results:
+            return
+        lower = np.concatenate([result[0] for result in results]).reshape(len(keys), 12, -1)
+        upper = np.concatenate([result[1] for result in results]).reshape(len(keys), 12, -1)
+
+        for row, (crime_type, neighbourhood) in enumerate(keys):
+            if crime_type not in self.crime_pindex_interval:
+                self.crime_pindex_interval[crime_type] = {}
+            intervals = {}
+            for year_index, year in enumerate(predict_years):
+                for month in range(1, 12 + 1):
+                    if not np.isnan(predict_occurrences[row * 12 + month - 1, year_index]):
+                        value_in_dict(int(year), intervals)
+                        intervals[int(year)][month] = \
+                            (float(lower[row, month - 1, year_index]),
+                             float(upper[row, month - 1, year_index]))
+            self.crime_pindex_interval[crime_type][neighbourhood] = intervals
+
+    def create_smoothed_pindex_data(self, fit_range: tuple[int, int],
+                                    predict_range: tuple[int, int],
+                                    adjacency: sparse.spmatrix,
+                                    region_ids: dict[str, int]) -> None:
+        """
+        Creates all the data that goes into the smoothed p-index dict, using the model of
+        create_pindex_data on the occurrences of each neighbourhood pooled with the occurrences of
+        its neighbours.
+
+        adjacency is the (regions x regions) adjacency matrix of the neighbourhoods and
+        region_ids maps the name of each neighbourhood to its row in adjacency. Neighbourhoods
+        that are not in region_ids get no smoothed p-indexes, and regions that no neighbourhood
+        maps to are left out of the pooling of their neighbours. The occurrences of all crime types
+        and months are pooled at once with a single sparse matrix product.
+
+        Preconditions:
+            - fit_range[1] < predict_range[0]
+            - adjacency.shape[0] == adjacency.shape[1]
+            - all(0 <= region < adjacency.shape[0] for region in region_ids.values())
+
+        Each crime and neighbourhood contains contiguous occurrences data from the beginning of the
+        fit range to the end of the fit range inclusive.
+        """
+        keys, array = self.occurrence_array((fit_range[0], predict_range[1]))
+        crime_types = list(self.crime_occurrences)
+        n_regions = adjacency.shape[0]
+        n_columns = array.shape[1] * 12
+
+        # occurrences of every region, with the crime types and months side by side; a crime
+        # type that was never recorded in a neighbourhood has zero occurrences there
+        counts = np.zeros((n_regions, len(crime_types) * n_columns))
+        present = np.zeros((n_regions, len(crime_types) * n_columns))
+        matched = np.zeros(n_regions)
+        matched[sorted(set(region_ids.values()))] = 1
+        present[matched == 1] = 1
+        for row, (crime_type, neighbourhood) in enumerate(keys):
+            if neighbourhood in region_ids:
+                columns = slice(crime_types.index(crime_type) * n_columns,
+                                (crime_types.index(crime_type) + 1) * n_columns)
+                values = array[row].reshape(-1)
+                counts[region_ids[neighbourhood], columns] = np.nan_to_num(values)
+                present[region_ids[neighbourhood], columns] = ~np.isnan(values)
+
+        # pool each matched region with its matched neighbours (the rows and columns of regions
+        # without data are zeroed); a pooled month is only known if it is known in all of the
+        # pooled regions
+        only_matched = sparse.diags(matched, format='csr')
+        pooling = (only_matched @ (adjacency + sparse.identity(n_regions, format='csr'))
+                   @ only_matched).tocsr()
+        pooled = pooling @ counts
+        complete = np.isclose(pooling @ present, np.asarray(pooling.sum(axis=1)))
+        pooled = np.where(complete, pooled, np.nan)
+
+        # one series per (crime, region, month): shape (crimes * regions * 12, years)
+        series = pooled.reshape(n_regions, len(crime_types), -1, 12).transpose(1, 0, 3, 2) \
+            .reshape(len(crime_types) * n_regions * 12, -1)
+        n_fit = fit_range[1] - fit_range[0] + 1
+        fit_years = np.arange(fit_range[0], fit_range[1] + 1)
+        predict_years = np.arange(predict_range[0], predict_range[1] + 1)
+        fit_occurrences = series[:, :n_fit]
+        predict_occurrences = series[:, -len(predict_years):]
+
+        slopes, intercepts = gen_batch_linear_regression(fit_years, fit_occurrences)
+        fitted = intercepts[:, np.newaxis] + slopes[:, np.newaxis] * fit_years
+        rmsd = np.sqrt(np.mean((fit_occurrences - fitted) ** 2, axis=1))
+        predictions = intercepts[:, np.newaxis] + slopes[:, np.newaxis] * predict_years
+        pindexes = gen_pindex_array(predict_occurrences, predictions, rmsd[:, np.newaxis]) \
+            .reshape(len(crime_types), n_regions, 12, -1)
+
+        for crime_type, neighbourhood in keys:
+            if neighbourhood in region_ids:
+                values = pindexes[crime_types.index(crime_type), region_ids[neighbourhood]]
+                p_index_dict = {}
+                for year_index, year in enumerate(predict_years.tolist()):
+                    for month in range(1, 12 + 1):
+                        if not np.isnan(values[month - 1, year_index]):
+                            value_in_dict(year, p_index_dict)
+                            p_index_dict[year][month] = float(values[month - 1, year_index])
+
+                if crime_type not in self.crime_pindex_smoothed:
+                    self.crime_pindex_smoothed[crime_type] = {}
+                self.crime_pindex_smoothed[crime_type][neighbourhood] = \
+                    NeighbourhoodCrimePooledPIndex((neighbourhood, crime_type), p_index_dict)
+
+
+def gen_bootstrap_batches(batches: list[tuple]) -> list[tuple[np.ndarray, np.ndarray]]:
+    """
+    Return the bounds returned by gen_bootstrap_pindex_bounds for each of batches, a list of
+    tuples of its arguments, in order. Used to compute a whole group of batches in one worker
+    process.
+    """
+    return [gen_bootstrap_pindex_bounds(*batch) for batch in batches]
 
 
 def set_null_in_range_to_zero(start_year_month: tuple[int, int], end_year_month: tuple[int, int],
@@ -122,19 +393,14 @@ def set_null_in_range_to_zero(start_year_month: tuple[int, int], end_year_month:
     True
 
     """
-    start_date = datetime.date(year=start_year_month[0], month=start_year_month[1], day=1)
-    end_date = datetime.date(year=end_year_month[0], month=end_year_month[1], day=1)
-
-    date_so_far = start_date
-
-    while date_so_far <= end_date:
+    for index in time_axis.month_range(start_year_month, end_year_month).tolist():
+        year, month = time_axis.year_month(index)
 
-        if date_so_far.year not in occurrences_dict:
-            occurrences_dict[date_so_far.year] = {}
+        if year not in occurrences_dict:
+            occurrences_dict[year] = {}
 
-        if date_so_far.month not in occurrences_dict[date_so_far.year]:
-            occurrences_dict[date_so_far.year][date_so_far.month] = 0
-        date_so_far += relativedelta.relativedelta(months=1)
+        if month not in occurrences_dict[year]:
+            occurrences_dict[year][month] = 0
 
 
 if __name__ == '__main__':
@@ -142,7 +408,8 @@ if __name__ == '__main__':
     doctest.testmod()
     import python_ta
     python_ta.check_all(config={
-        'extra-imports': ['datetime', 'dateutil', 'neighbourhood_crime'],
+        'extra-imports': ['os', 'concurrent.futures', 'typing', 'numpy', 'scipy', 'time_axis',
+                          'neighbourhood_crime', 'stat_analysis'],
         'max-line-length': 100,
         'disable': ['R1705', 'C0200']
     })
@@ -0,0 +1,44 @@
+"""
+Helpers for the files that are cached or reprocessed only when their contents change.
+
+Files are identified by the checksum of their contents rather than by their modification
+time, so copying or touching a file does not invalidate the results computed from it.
+"""
+import hashlib
+
+# number of bytes read at a time when computing a checksum
+CHECKSUM_BLOCK_SIZE = 1 << 20
+
+
+def file_checksum(path: str) -> str:
+    """
+    Return the hexadecimal SHA-256 checksum of the contents of the file at path.
+
+    >>> import os, tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), 'empty.txt')
+    >>> open(path, 'w').close()
+    >>> file_checksum(path)[:16]
+    'e3b0c44298fc1c14'
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(CHECKSUM_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'extra-imports': ['hashlib'],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200']
+    })
+
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
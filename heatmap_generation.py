@@ -4,84 +4,289 @@ Functions to generate a heatmap given p-index data in the form of a CrimeData ob
 David De Martin
 """
 
+import base64
+import json
+from typing import Union
 import plotly.express as px
+import plotly.graph_objects as go
+import numpy as np
 import pandas as pd
-import json
+import time_axis
 from crime_data import CrimeData
+from neighbourhood_crime import NeighbourhoodCrimePIndex, NeighbourhoodCrimePooledPIndex
+from neighbourhood_index import NeighbourhoodIndex, load_neighbourhood_index
 import dash
 from dash import dcc
 from dash import html
 
+# Builds the animated figure of a crime type in the browser from the payload of
+# pack_pindex_arrays and the neighbourhood boundaries, with the same look as create_figure.
+CLIENT_SIDE_FIGURE = """
+function (crime, layer, payload, geojson) {
+    const arrays = layer === 'smoothed' ? payload.smoothed_pindexes : payload.pindexes;
+    const title = '<b>P-index graph for ' + crime + (layer === 'smoothed' ? ' (smoothed)' : '')
+        + '</b>';
+    const bytes = Uint8Array.from(atob(arrays[crime]), c => c.charCodeAt(0));
+    const values = new Float32Array(bytes.buffer);
+    const width = payload.locations.length;
+    const frames = payload.months.map((month, row) => ({
+        name: month,
+        data: [{z: Array.from(values.subarray(row * width, (row + 1) * width),
+                              v => Number.isNaN(v) ? null : v)}]
+    }));
+    const animation = {frame: {duration: 500, redraw: true}, mode: 'immediate',
+                       fromcurrent: true, transition: {duration: 0}};
+    const still = {frame: {duration: 0, redraw: true}, mode: 'immediate',
+                   transition: {duration: 0}};
+    return {
+        data: [{type: 'choroplethmapbox', geojson: geojson, locations: payload.locations,
+                z: frames.length > 0 ? frames[0].data[0].z : [],
+                zmin: -100, zmax: 100, marker: {opacity: 0.5},
+                colorscale: [[0, 'LawnGreen'], [0.5, 'LightBlue'], [1, 'DarkRed']],
+                colorbar: {title: {text: 'p-index'}},
+                text: payload.names,
+                hovertemplate: 'date=%{meta}<br>region=%{text}<br>p-index=%{z}<extra></extra>',
+                meta: payload.months[0]}],
+        frames: frames.map(frame => ({name: frame.name,
+                                      data: [{z: frame.data[0].z, meta: frame.name}]})),
+        layout: {
+            title: {text: title},
+            height: 750,
+            mapbox: {style: 'carto-positron', zoom: 11,
+                     center: {lat: 49.24200376111951, lon: -123.13312355113719}},
+            updatemenus: [{type: 'buttons', direction: 'left', x: 0.1, y: 0, xanchor: 'right',
+                           yanchor: 'top', pad: {r: 10, t: 70}, showactive: false,
+                           buttons: [{label: '&#9654;', method: 'animate',
+                                      args: [null, animation]},
+                                     {label: '&#9724;', method: 'animate',
+                                      args: [[null], still]}]}],
+            sliders: [{active: 0, x: 0.1, y: 0, xanchor: 'left', yanchor: 'top', len: 0.9,
+                       pad: {b: 10, t: 60}, currentvalue: {prefix: 'date='},
+                       steps: payload.months.map(month => ({
+                           label: month, method: 'animate', args: [[month], still]}))}]
+        }
+    };
+}
+"""
 
-def generate_heatmap(data: CrimeData) -> None:
+
+def generate_heatmap(data: CrimeData, client_side: bool = False) -> None:
     """Generate an animated heatmap for the pindexes of the CrimeData,
-    data, with a dropdown menu to switch between crime type."""
-    # open the geojson file of the neighbourhood boundaries
-    with open('local-area-boundary.geojson') as file:
-        regions = json.load(file)
+    data, with a dropdown menu to switch between crime type.
 
-    # Create a pandas dataframe with all the necessary data
-    unpacked_data = unpack_data(data)
-    df = pd.DataFrame({'date': unpacked_data[0],
-                       'region': unpacked_data[1],
-                       'p-index': unpacked_data[2],
-                       'crime-type': unpacked_data[3]})
+    If data has a smoothed p-index layer (see spatial_smoothing.add_smoothed_layer), radio
+    buttons switch between the p-indexes of each neighbourhood and the smoothed ones.
+
+    If client_side is True, the browser receives the neighbourhood boundaries and the
+    p-indexes of every crime type once, and the figure for a crime type is built in the browser
+    by a clientside callback, so switching crime type does not contact the server at all."""
+    index, region_ids = load_region_index(data)
 
     # extract a list containing the names of all crime types
     crime_types = list(data.crime_pindex.keys())
 
     # Create a dash app with a dropdown menu so that we can switch between graphs
     app = dash.Dash()
-    app.layout = html.Div([
-        dcc.Dropdown(
-            id='crime-type-dropdown',
-            options=[{'label': crime, 'value': crime} for crime in crime_types],
-            value=crime_types[0]
-        ),
-        dcc.Graph(id='choropleth-graph')])
-
-    # this function is called every time the dropdown menu is updated.
-    @app.callback(
-        dash.dependencies.Output('choropleth-graph', 'figure'),
-        [dash.dependencies.Input('crime-type-dropdown', 'value')])
-    def update_output(crime: str):
-        """Update which graph is shown in our app by returning the pertinent figure."""
-        fig = px.choropleth_mapbox(df[df['crime-type'] == crime], geojson=regions,
-                                   locations='region',
-                                   color='p-index',
-                                   color_continuous_scale=['LawnGreen', 'LightBlue', 'DarkRed'],
-                                   range_color=(-100, 100),
-                                   featureidkey="properties.name",
-                                   mapbox_style="carto-positron",
-                                   opacity=0.5,
-                                   center={"lat": 49.24200376111951, "lon": -123.13312355113719},
-                                   zoom=11,
-                                   animation_frame='date',
-                                   height=750)
-
-        fig.update_geos(fitbounds="locations", visible=False)
-        fig.update_layout(title=f'<b>P-index graph for {crime}</b>')
-        return fig
+    dropdown = dcc.Dropdown(
+        id='crime-type-dropdown',
+        options=[{'label': crime, 'value': crime} for crime in crime_types],
+        value=crime_types[0]
+    )
+    layer_radio = dcc.RadioItems(
+        id='layer-radio',
+        options=[{'label': 'Neighbourhood', 'value': 'neighbourhood'},
+                 {'label': 'Smoothed with adjacent neighbourhoods', 'value': 'smoothed'}],
+        value='neighbourhood',
+        style={} if data.crime_pindex_smoothed else {'display': 'none'}
+    )
+
+    if client_side:
+        app.layout = html.Div([
+            dropdown,
+            layer_radio,
+            dcc.Graph(id='choropleth-graph'),
+            dcc.Store(id='geometry-store', data=index.geojson),
+            dcc.Store(id='pindex-store', data=pack_pindex_arrays(data, region_ids))])
+
+        # this function is run in the browser every time the dropdown menu or layer is updated.
+        app.clientside_callback(
+            CLIENT_SIDE_FIGURE,
+            dash.dependencies.Output('choropleth-graph', 'figure'),
+            [dash.dependencies.Input('crime-type-dropdown', 'value'),
+             dash.dependencies.Input('layer-radio', 'value')],
+            [dash.dependencies.State('pindex-store', 'data'),
+             dash.dependencies.State('geometry-store', 'data')])
+    else:
+        dfs = {'neighbourhood': create_dataframe(data, region_ids),
+               'smoothed': create_dataframe(data, region_ids, smoothed=True)}
+        app.layout = html.Div([dropdown, layer_radio, dcc.Graph(id='choropleth-graph')])
+
+        # this function is called every time the dropdown menu or layer is updated.
+        @app.callback(
+            dash.dependencies.Output('choropleth-graph', 'figure'),
+            [dash.dependencies.Input('crime-type-dropdown', 'value'),
+             dash.dependencies.Input('layer-radio', 'value')])
+        def update_output(crime: str, layer: str):
+            """Update which graph is shown in our app by returning the pertinent figure."""
+            fig = create_figure(dfs[layer], crime, index.geojson)
+            if layer == 'smoothed':
+                fig.update_layout(title=f'<b>P-index graph for {crime} (smoothed)</b>')
+            return fig
 
     # start the dash server (port will be printed in console automatically)
     app.run_server()
 
 
-def unpack_data(data: CrimeData) -> tuple[list[str], list[str], list[float], list[str]]:
+def load_region_index(data: CrimeData) -> tuple[NeighbourhoodIndex, dict[str, int]]:
+    """Build the join index between the neighbourhood names of data and the boundary polygons,
+    and return it together with the neighbourhood id of every neighbourhood name that matches a
+    polygon. The names that do not match are printed."""
+    index = load_neighbourhood_index('local-area-boundary.geojson')
+    region_ids = index.match({neighbourhood for crime in data.crime_pindex.values()
+                              for neighbourhood in crime})
+    if index.unmatched:
+        print('Neighbourhoods without a boundary polygon (not shown on the map):',
+              ', '.join(sorted(index.unmatched)))
+    return index, region_ids
+
+
+def create_dataframe(data: CrimeData, region_ids: dict[str, int],
+                     smoothed: bool = False) -> pd.DataFrame:
+    """Create a pandas dataframe with all the p-index data of data (of its smoothed layer if
+    smoothed is True), with the name of each region and its integer id in 'region-id', which is
+    used to join the regions to their polygons. Regions that are not in region_ids are left
+    out."""
+    unpacked_data = unpack_data(data, smoothed)
+    df = pd.DataFrame({'date': unpacked_data[0],
+                       'region': unpacked_data[1],
+                       'p-index': unpacked_data[2],
+                       'crime-type': unpacked_data[3]})
+    df['region-id'] = df['region'].map(region_ids)
+    return df.dropna(subset=['region-id']).astype({'region-id': int})
+
+
+def create_figure(df: pd.DataFrame, crime: str, geojson: dict) -> go.Figure:
+    """Return the animated choropleth of the p-indexes of crime in df, a dataframe created by
+    create_dataframe. Regions are joined to their polygons by id, and labelled by name."""
+    fig = px.choropleth_mapbox(df[df['crime-type'] == crime], geojson=geojson,
+                               locations='region-id',
+                               color='p-index',
+                               hover_data={'region': True, 'region-id': False},
+                               color_continuous_scale=['LawnGreen', 'LightBlue', 'DarkRed'],
+                               range_color=(-100, 100),
+                               mapbox_style="carto-positron",
+                               opacity=0.5,
+                               center={"lat": 49.24200376111951, "lon": -123.13312355113719},
+                               zoom=11,
+                               animation_frame='date',
+                               height=750)
+
+    fig.update_geos(fitbounds="locations", visible=False)
+    fig.update_layout(title=f'<b>P-index graph for {crime}</b>')
+    return fig
+
+
+def pack_pindex_arrays(data: CrimeData, region_ids: dict[str, int]) -> dict:
+    """Pack the p-indexes of data into the compact payload used by the clientside heatmap:
+
+        - 'months': the label of every month that has a p-index, in chronological order.
+        - 'locations': the neighbourhood id of every region, in column order.
+        - 'names': the name of every region, in column order, shown when hovering over it.
+        - 'pindexes': maps each crime type to a base64 string of the little-endian float32
+        array of shape (months, locations) holding its p-indexes. Missing values are NaN.
+        - 'smoothed_pindexes': the same as 'pindexes' for the smoothed p-index layer (empty if
+        data has no smoothed layer).
+
+    Regions that are not in region_ids are left out.
+    """
+    layers = [data.crime_pindex, data.crime_pindex_smoothed]
+    month_indexes = sorted({time_axis.month_index(year, month)
+                            for layer in layers
+                            for crime in layer.values()
+                            for obj in crime.values()
+                            for year in obj.p_index_dict
+                            for month in obj.p_index_dict[year]})
+    rows = {month_index: row for row, month_index in enumerate(month_indexes)}
+    locations = sorted(set(region_ids.values()))
+    location_columns = {location: column for column, location in enumerate(locations)}
+    columns = {neighbourhood: location_columns[region_id]
+               for neighbourhood, region_id in region_ids.items()}
+    names = [', '.join(sorted(neighbourhood for neighbourhood, region_id in region_ids.items()
+                              if region_id == location)) for location in locations]
+
+    return {'months': time_axis.month_labels(np.array(month_indexes, dtype=int)),
+            'locations': locations,
+            'names': names,
+            'pindexes': pack_layer(data.crime_pindex, rows, columns),
+            'smoothed_pindexes': pack_layer(data.crime_pindex_smoothed, rows, columns)}
+
+
+def pack_layer(layer: dict[str, dict[str, Union[NeighbourhoodCrimePIndex,
+                                                NeighbourhoodCrimePooledPIndex]]],
+               rows: dict[int, int], columns: dict[str, int]) -> dict[str, str]:
+    """Return a dict mapping each crime type of a p-index layer of a CrimeData object to a base64
+    string of the little-endian float32 array holding its p-indexes, with the row of each month
+    index given by rows and the column of each neighbourhood given by columns. Neighbourhoods
+    that are not in columns are left out and missing values are NaN.
+    """
+    n_columns = len(set(columns.values()))
+    packed = {}
+    for crime in layer:
+        array = np.full((len(rows), n_columns), np.nan, dtype='<f4')
+        for neighbourhood, obj in layer[crime].items():
+            if neighbourhood in columns:
+                for year in obj.p_index_dict:
+                    for month, p_index in obj.p_index_dict[year].items():
+                        array[rows[time_axis.month_index(year, month)],
+                              columns[neighbourhood]] = p_index
+        packed[crime] = base64.b64encode(array.tobytes()).decode('ascii')
+    return packed
+
+
+def measure_payload_bytes(data: CrimeData) -> dict[str, int]:
+    """Return the number of bytes of JSON the heatmap sends to the browser in each mode:
+
+        - 'server_initial' and 'server_per_interaction': the (average) size of the figure
+        the server sends on page load and on every change of crime type.
+        - 'client_initial' and 'client_per_interaction': the size of the geometry and p-index
+        stores sent once on page load, and nothing afterwards.
+    """
+    index, region_ids = load_region_index(data)
+    df = create_dataframe(data, region_ids)
+    figure_sizes = [len(create_figure(df, crime, index.geojson).to_json())
+                    for crime in data.crime_pindex]
+
+    return {'server_initial': figure_sizes[0],
+            'server_per_interaction': sum(figure_sizes) // len(figure_sizes),
+            'client_initial': len(json.dumps(index.geojson))
+            + len(json.dumps(pack_pindex_arrays(data, region_ids))),
+            'client_per_interaction': 0}
+
+
+def unpack_data(data: CrimeData, smoothed: bool = False) \
+        -> tuple[list[str], list[str], list[float], list[str]]:
     """Unpack the data in CrimeData into three lists, one corresponding to the dates, one to the
     regions, one to the pindexes, and one for the crime types.
+
+    If smoothed is True, the smoothed p-index layer of data is unpacked instead.
     
     (It's hard to create a doctest because the CrimeData object cannot be created/built simply)
     """
-    dates = []
+    month_indexes = []
     regions = []
     pindexes = []
     crime_types = []
 
+    layer: dict[str, dict[str, Union[NeighbourhoodCrimePIndex, NeighbourhoodCrimePooledPIndex]]]
+    if smoothed:
+        layer = data.crime_pindex_smoothed
+    else:
+        layer = data.crime_pindex
+
     # loop through every crime type
-    for crime in data.crime_pindex:
-        # loop through each NeighbourhoodCrimePIndex object
-        for obj in data.crime_pindex[crime].values():
+    for crime in layer:
+        # loop through each NeighbourhoodCrimePIndex (or NeighbourhoodCrimePooledPIndex) object
+        for obj in layer[crime].values():
             # get all the years in chronological order
             years = sorted(list(obj.p_index_dict.keys()))
             
@@ -91,11 +296,14 @@ def unpack_data(data: CrimeData) -> tuple[list[str], list[str], list[float], lis
                 
                 for month in months:
                     # append the pertinent data to the lists
-                    dates.append(month_year_to_str(month, year))
+                    month_indexes.append(time_axis.month_index(year, month))
                     regions.append(obj.neighbourhood)
                     pindexes.append(obj.get_data(year, month))
                     crime_types.append(crime)
 
+    # label each distinct month once rather than formatting a date string per row
+    dates = time_axis.month_labels(np.array(month_indexes, dtype=int))
+
     return dates, regions, pindexes, crime_types
 
 
@@ -106,8 +314,7 @@ def month_year_to_str(month: int, year: int) -> str:
     >>> month_year_to_str(10, 2021)
     'Oct 2021'
     """
-    months = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
-    return f'{months[month - 1]} {year}'
+    return time_axis.month_label(time_axis.month_index(year, month))
 
 if __name__ == '__main__':
     import doctest
@@ -115,7 +322,8 @@ if __name__ == '__main__':
     
     import python_ta
     python_ta.check_all(config={
-        'extra-imports': ['plotly', 'pandas', 'json', 'crime_data', 'dash'],
+        'extra-imports': ['base64', 'json', 'typing', 'plotly', 'numpy', 'pandas', 'time_axis',
+                          'crime_data', 'neighbourhood_crime', 'neighbourhood_index', 'dash'],
         'max-line-length': 100,
         'disable': ['R1705', 'C0200']
     })
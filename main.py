@@ -7,6 +7,7 @@ Benedek Balla, Martin Calcaterra, David De Martin, Daniel Dervishi
 """
 import process_csv
 import heatmap_generation
+import spatial_smoothing
 
 if __name__ == '__main__':
     crime_data = process_csv.get_vancouver_data('./crime_data_vancouver.csv',
@@ -17,4 +18,7 @@ if __name__ == '__main__':
     # from 2014 to 2019; the start value can be changed to go as far back as 2003.
 
     crime_data.create_pindex_data((2014, 2019), (2020, 2021))
+
+    # the same model, fit to each neighbourhood pooled with its adjacent neighbourhoods
+    spatial_smoothing.add_smoothed_layer(crime_data, (2014, 2019), (2020, 2021))
     heatmap_generation.generate_heatmap(crime_data)
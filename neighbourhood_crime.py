@@ -4,6 +4,7 @@ as well as pindex data.
 
 Daniel Dervishi, David De Martin, Martin Calcaterra
 """
+from __future__ import annotations
 
 from stat_analysis import gen_linear_regression, gen_rmsd, gen_z, gen_p, gen_pindex
 
@@ -152,16 +153,73 @@ class NeighbourhoodCrimePIndex(NeighbourhoodCrime):
 
                 if month in neighbourhood_crime_occurrences.occurrences[year]:
 
-                    z = gen_z(
+                    value_in_dict(year, self.p_index_dict)
+                    self.p_index_dict[year][month] = model_pindex(
                         neighbourhood_crime_occurrences.occurrences[year][month],
                         month_model.predict([[year]]), rmsd)
 
-                    p = gen_p(z[0])
+    @classmethod
+    def from_p_index_dict(cls, neighbourhood_crime_type: tuple[str, str],
+                          p_index_dict: dict[int, dict[int, float]]) -> NeighbourhoodCrimePIndex:
+        """Return a NeighbourhoodCrimePIndex object with the neighbourhood and crime_type in
+        neighbourhood_crime_type and the p_index_dict already computed by the same model (for
+        example by CrimeData.create_pindex_data for all neighbourhoods at once), without
+        fitting the model again.
+
+        >>> p_index = NeighbourhoodCrimePIndex.from_p_index_dict(('Sunset', 'Mischief'), \
+        {2020: {1: 12.5}})
+        >>> p_index.neighbourhood, p_index.get_data(2020, 1)
+        ('Sunset', 12.5)
+        """
+        p_index = cls.__new__(cls)
+        NeighbourhoodCrime.__init__(p_index, neighbourhood=neighbourhood_crime_type[0],
+                                    crime_type=neighbourhood_crime_type[1])
+        p_index.p_index_dict = p_index_dict
+        return p_index
 
-                    p_index = gen_pindex(p, z[1])
+    def get_data(self, year: int, month: int) -> float:
+        """Returns p-index of a given year and month
+
+        Preconditions:
+            - year >= 0
+            - 1 <= month <= 12
+        """
+        return self.p_index_dict[year][month]
 
-                    value_in_dict(year, self.p_index_dict)
-                    self.p_index_dict[year][month] = p_index
+
+class NeighbourhoodCrimePooledPIndex(NeighbourhoodCrime):
+    """
+    Stores p-index in a neighbourhood for a certain crime in a given year and month, where the
+    p-indexes were computed from the occurrences of the neighbourhood pooled with the
+    occurrences of its neighbours, rather than from the occurrences of this neighbourhood.
+
+    Instance Attributes:
+        - p_index_dict: dictionary that maps a specific year to a dictionary of months which map to
+        the p-value associated with this month.
+
+    Representation Invariants:
+        - all(-100 <= p_value <= 100 for month_dict in self.p_index_dict.values() for p_value \
+        in month_dict.values())
+    """
+    p_index_dict: dict[int, dict[int, float]]
+
+    def __init__(self, neighbourhood_crime_type: tuple[str, str],
+                 p_index_dict: dict[int, dict[int, float]]) -> None:
+        """Initialize this NeighbourhoodCrimePooledPIndex object with the neighbourhood and
+        crime_type in neighbourhood_crime_type and an already computed p_index_dict.
+
+        Parameters:
+            - neighbourhood_crime_type: tuple containing neighbourhood at the first index and
+            crime type at the second index, both as strings.
+
+        >>> pooled = NeighbourhoodCrimePooledPIndex(('Sunset', 'Mischief'), {2020: {1: 12.5}})
+        >>> pooled.get_data(2020, 1)
+        12.5
+        """
+        NeighbourhoodCrime.__init__(self, neighbourhood=neighbourhood_crime_type[0],
+                                    crime_type=neighbourhood_crime_type[1])
+
+        self.p_index_dict = p_index_dict
 
     def get_data(self, year: int, month: int) -> float:
         """Returns p-index of a given year and month
@@ -173,6 +231,41 @@ class NeighbourhoodCrimePIndex(NeighbourhoodCrime):
         return self.p_index_dict[year][month]
 
 
+def gen_month_pindex(neighbourhood_crime_occurrences: NeighbourhoodCrimeOccurrences,
+                     fit_range: tuple[int, int], year_month: tuple[int, int]) -> float:
+    """Return the p-index of a single year and month of neighbourhood_crime_occurrences, using
+    the same model as NeighbourhoodCrimePIndex but fitting only the month that is needed.
+
+    Preconditions:
+        - fit_range[1] < year_month[0]
+        - year_month[1] in neighbourhood_crime_occurrences.occurrences[year_month[0]]
+
+    Neighbourhood_crime_occurrences contains contiguous data from the beginning of the
+    fit range to the end of the fit range.
+    """
+    year, month = year_month
+    monthly_occurrences = neighbourhood_crime_occurrences.get_occurrences(month, fit_range)
+    month_model = gen_linear_regression(monthly_occurrences)
+    rmsd = gen_rmsd(monthly_occurrences, month_model)
+
+    return model_pindex(neighbourhood_crime_occurrences.occurrences[year][month],
+                        month_model.predict([[year]]), rmsd)
+
+
+def model_pindex(observation: int, prediction: float, rmsd: float) -> float:
+    """Return the p-index of an observation given the prediction of the model and the RMSD of
+    the model.
+
+    Preconditions:
+        - rmsd >= 0
+    """
+    z = gen_z(observation, prediction, rmsd)
+
+    p = gen_p(z[0])
+
+    return gen_pindex(p, z[1])
+
+
 def value_in_dict(key: int, dictionary: dict) -> None:
     """
     Checks if the key is in the dictionary, sets value at this key to an empty dictionary if not.
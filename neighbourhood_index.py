@@ -0,0 +1,128 @@
+"""
+A join index between the neighbourhood names used in the crime data and the neighbourhood
+polygons of the boundary GeoJSON file.
+
+Names are matched after normalization (case, spacing and punctuation are ignored) and through
+a table of known aliases. Every polygon is given a small integer neighbourhood id, so figures
+can refer to neighbourhoods by id instead of repeating their names.
+"""
+import json
+import re
+from typing import Iterable, Optional
+
+# maps normalized names used by the Vancouver Police Department to normalized polygon names
+NEIGHBOURHOOD_ALIASES = {
+    'central business district': 'downtown',
+}
+
+
+class NeighbourhoodIndex:
+    """A join index from neighbourhood names to integer neighbourhood ids, one per polygon.
+
+    Instance Attributes:
+        - names: the polygon name of each neighbourhood, indexed by neighbourhood id.
+        - ids: maps each normalized polygon name and alias to its neighbourhood id.
+        - geojson: the boundary feature collection, with the 'id' of every feature set to its
+        neighbourhood id.
+        - unmatched: the names passed to match that have no polygon.
+
+    Representation Invariants:
+        - all(0 <= neighbourhood_id < len(self.names) for neighbourhood_id in self.ids.values())
+    """
+    names: list[str]
+    ids: dict[str, int]
+    geojson: dict
+    unmatched: set[str]
+
+    def __init__(self, geojson: dict, aliases: Optional[dict[str, str]] = None) -> None:
+        """Initialize the index from the features of a GeoJSON feature collection whose features
+        have a 'name' property, and a dict of aliases mapping normalized names to normalized
+        polygon names (NEIGHBOURHOOD_ALIASES if aliases is None).
+
+        >>> index = NeighbourhoodIndex({'type': 'FeatureCollection', 'features': [ \
+        {'type': 'Feature', 'properties': {'name': 'Downtown'}, 'geometry': None}, \
+        {'type': 'Feature', 'properties': {'name': 'Arbutus-Ridge'}, 'geometry': None}]})
+        >>> index.names
+        ['Downtown', 'Arbutus-Ridge']
+        >>> index.match(['Arbutus Ridge', 'Central Business District', 'Musqueam'])
+        {'Arbutus Ridge': 1, 'Central Business District': 0}
+        >>> index.unmatched
+        {'Musqueam'}
+        >>> [feature['id'] for feature in index.geojson['features']]
+        [0, 1]
+        """
+        if aliases is None:
+            aliases = NEIGHBOURHOOD_ALIASES
+
+        self.names = []
+        self.ids = {}
+        self.unmatched = set()
+
+        features = []
+        for neighbourhood_id, feature in enumerate(geojson['features']):
+            name = feature['properties']['name']
+            self.names.append(name)
+            self.ids[normalize_name(name)] = neighbourhood_id
+            features.append({**feature, 'id': neighbourhood_id})
+        self.geojson = {**geojson, 'features': features}
+
+        for alias, name in aliases.items():
+            if name in self.ids:
+                self.ids[alias] = self.ids[name]
+
+    def get_id(self, name: str) -> Optional[int]:
+        """Return the neighbourhood id of name, or None if no polygon matches it.
+        """
+        return self.ids.get(normalize_name(name))
+
+    def match(self, names: Iterable[str]) -> dict[str, int]:
+        """Return a dict mapping each of names that matches a polygon to its neighbourhood id.
+        The names that match no polygon are added to self.unmatched.
+        """
+        matched = {}
+        for name in names:
+            neighbourhood_id = self.get_id(name)
+            if neighbourhood_id is None:
+                self.unmatched.add(name)
+            else:
+                matched[name] = neighbourhood_id
+        return matched
+
+
+def load_neighbourhood_index(path: str) -> NeighbourhoodIndex:
+    """Return the NeighbourhoodIndex of the boundary GeoJSON file at path.
+    """
+    with open(path) as file:
+        return NeighbourhoodIndex(json.load(file))
+
+
+def normalize_name(name: str) -> str:
+    """Return name in lower case, with '&' spelled out and every run of spaces and punctuation
+    replaced by a single space.
+
+    >>> normalize_name('Arbutus-Ridge')
+    'arbutus ridge'
+    >>> normalize_name('  Kensington - Cedar  Cottage ')
+    'kensington cedar cottage'
+    >>> normalize_name('Victoria & Fraserview')
+    'victoria and fraserview'
+    """
+    name = name.casefold().replace('&', ' and ')
+    return ' '.join(re.split(r'[^0-9a-z]+', name)).strip()
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'extra-imports': ['json', 're', 'typing'],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200']
+    })
+
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
@@ -0,0 +1,227 @@
+"""
+A collection of functions to process a raw CSV file of crime incidents out-of-core.
+
+The raw file is streamed in chunks and split by year into partition files on disk. Each
+partition is then aggregated independently (optionally in parallel) into partial counts,
+which are merged into the final monthly table. A manifest of partition checksums is kept
+next to the partitions so that, when a new raw export arrives, only the partitions whose
+contents changed are aggregated again.
+"""
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from file_utils import file_checksum
+from process_csv import count_occurrences, crime_data_to_dataframe, dataframe_to_crime_data
+
+MANIFEST_FILE = 'manifest.json'
+
+
+def create_csv_partitioned(raw_path: str, processed_path: str, partition_dir: str,
+                           necessary_columns: list, start_year_month: tuple[int, int],
+                           end_year_month: tuple[int, int], processes: int = 1,
+                           chunksize: int = 100000) -> list[int]:
+    """
+    Out-of-core version of process_csv.create_csv that writes the same processed CSV to
+    processed_path without ever holding the whole raw file in memory.
+
+    The raw file at raw_path is partitioned by year into partition_dir. Only partitions within
+    the range start_year_month to end_year_month whose checksum differs from the one recorded in
+    the manifest of partition_dir (or that have never been aggregated) are aggregated again,
+    using up to processes worker processes. Return the sorted list of years that were
+    aggregated during this call.
+
+    Preconditions:
+        - necessary_columns == ['TYPE','NEIGHBOURHOOD', 'YEAR', 'MONTH']
+        - start_year_month < end_year_month
+        - processes >= 1
+        - chunksize >= 1
+
+    >>> import tempfile
+    >>> from process_csv import create_csv
+    >>> directory = tempfile.mkdtemp()
+    >>> raw = os.path.join(directory, 'raw.csv')
+    >>> columns = ['TYPE', 'NEIGHBOURHOOD', 'YEAR', 'MONTH']
+    >>> pd.DataFrame({'TYPE': ['Mischief', 'Mischief', 'Homicide', 'Mischief'], \
+    'YEAR': [2003, 2003, 2003, 2004], 'MONTH': [1, 1, 2, 3], \
+    'NEIGHBOURHOOD': ['Sunset', 'Sunset', 'Sunset', 'Fairview']}).to_csv(raw, index=False)
+    >>> parts = os.path.join(directory, 'partitions')
+    >>> create_csv_partitioned(raw, os.path.join(directory, 'out.csv'), parts, columns, \
+    (2003, 1), (2004, 12), chunksize=2)
+    [2003, 2004]
+    >>> create_csv_partitioned(raw, os.path.join(directory, 'out.csv'), parts, columns, \
+    (2003, 1), (2004, 12), chunksize=2)
+    []
+    >>> with open(raw, 'a') as file:
+    ...     _ = file.write('Homicide,2004,5,Fairview\\n')
+    >>> create_csv_partitioned(raw, os.path.join(directory, 'out.csv'), parts, columns, \
+    (2003, 1), (2004, 12), chunksize=2)
+    [2004]
+    >>> create_csv(raw, os.path.join(directory, 'expected.csv'), columns, (2003, 1), (2004, 12))
+    >>> key = ['crime_type', 'neighbourhood', 'year', 'month']
+    >>> expected = pd.read_csv(os.path.join(directory, 'expected.csv')).sort_values(key)
+    >>> actual = pd.read_csv(os.path.join(directory, 'out.csv')).sort_values(key)
+    >>> expected.reset_index(drop=True).equals(actual.reset_index(drop=True))
+    True
+    """
+    os.makedirs(partition_dir, exist_ok=True)
+
+    years = [year for year in partition_by_year(raw_path, partition_dir, necessary_columns,
+                                                 chunksize)
+             if start_year_month[0] <= year <= end_year_month[0]]
+
+    # compare the checksums of the new partitions to the ones that were last aggregated
+    manifest = load_manifest(partition_dir)
+    checksums = {year: file_checksum(partition_path(partition_dir, year)) for year in years}
+    changed = [year for year in years
+               if manifest.get(str(year)) != checksums[year]
+               or not os.path.exists(counts_path(partition_dir, year))]
+
+    aggregate_partitions(partition_dir, changed, processes)
+
+    # only record a checksum once its partition has been aggregated
+    save_manifest(partition_dir, {str(year): checksums[year] for year in years})
+
+    # merge the partial counts and fill the gaps in exactly the same way as create_csv
+    df = merge_partition_counts(partition_dir, years)
+    crime_data = dataframe_to_crime_data(df, (0, 1, 2, 3, 4), start_year_month, end_year_month)
+    crime_data.fill_gaps(start_year_month, end_year_month)
+    crime_data_to_dataframe(crime_data).to_csv(processed_path, index=False)
+
+    return changed
+
+
+def partition_by_year(raw_path: str, partition_dir: str, necessary_columns: list,
+                      chunksize: int) -> list[int]:
+    """
+    Stream the raw CSV at raw_path in chunks of chunksize rows and write the necessary columns
+    of every observation without empty values to the partition file of its year in
+    partition_dir. Existing partition files are overwritten. Return the sorted list of years
+    that have a partition.
+
+    Preconditions:
+        - 'YEAR' in necessary_columns and 'MONTH' in necessary_columns
+        - chunksize >= 1
+    """
+    years_written = set()
+    for chunk in pd.read_csv(raw_path, usecols=necessary_columns, chunksize=chunksize):
+        # remove all rows with empty entries
+        chunk = chunk.dropna()
+        # a column with an empty entry is read as floats, so cast the remaining rows back
+        chunk = chunk.astype({'YEAR': int, 'MONTH': int})
+
+        for year, rows in chunk.groupby('YEAR', sort=True):
+            year = int(year)
+            first_write = year not in years_written
+            rows.to_csv(partition_path(partition_dir, year), index=False,
+                        mode='w' if first_write else 'a', header=first_write)
+            years_written.add(year)
+
+    return sorted(years_written)
+
+
+def aggregate_partitions(partition_dir: str, years: list[int], processes: int) -> None:
+    """
+    Aggregate the partition of each year in years into its partial counts file, using up to
+    processes worker processes.
+
+    Preconditions:
+        - processes >= 1
+        - all(os.path.exists(partition_path(partition_dir, year)) for year in years)
+    """
+    sources = [partition_path(partition_dir, year) for year in years]
+    destinations = [counts_path(partition_dir, year) for year in years]
+
+    if processes == 1 or len(years) <= 1:
+        for source, destination in zip(sources, destinations):
+            aggregate_partition(source, destination)
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            # consume the results so that errors in the workers are raised here
+            list(executor.map(aggregate_partition, sources, destinations))
+
+
+def aggregate_partition(source: str, destination: str) -> None:
+    """
+    Count the number of occurrences of each crime type, neighbourhood, year and month in the
+    partition file at source and write the partial counts to destination.
+    """
+    df = pd.read_csv(source)
+    count_occurrences(df).to_csv(destination, index=False)
+
+
+def merge_partition_counts(partition_dir: str, years: list[int]) -> pd.DataFrame:
+    """
+    Merge the partial counts of each year in years into a single dataframe with the columns
+    'TYPE', 'NEIGHBOURHOOD', 'YEAR', 'MONTH' and 'COUNT'.
+
+    Preconditions:
+        - all(os.path.exists(counts_path(partition_dir, year)) for year in years)
+    """
+    columns = ['TYPE', 'NEIGHBOURHOOD', 'YEAR', 'MONTH', 'COUNT']
+    if years == []:
+        return pd.DataFrame({column: [] for column in columns})
+
+    df = pd.concat([pd.read_csv(counts_path(partition_dir, year)) for year in years],
+                   ignore_index=True)
+
+    # partitions never share a year, but summing keeps the merge correct for any partitioning
+    return df.groupby(columns[:4], as_index=False, sort=False)['COUNT'].sum()
+
+
+def load_manifest(partition_dir: str) -> dict[str, str]:
+    """
+    Return the manifest of partition_dir, mapping each aggregated year (as a string) to the
+    checksum of its partition. Return an empty dict if there is no manifest yet.
+    """
+    path = os.path.join(partition_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_manifest(partition_dir: str, manifest: dict[str, str]) -> None:
+    """
+    Write manifest to the manifest file of partition_dir, replacing the previous one.
+    """
+    with open(os.path.join(partition_dir, MANIFEST_FILE), 'w') as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+
+
+def partition_path(partition_dir: str, year: int) -> str:
+    """
+    Return the path of the partition file holding the raw observations of year.
+
+    >>> partition_path('partitions', 2003).replace(os.sep, '/')
+    'partitions/incidents-2003.csv'
+    """
+    return os.path.join(partition_dir, f'incidents-{year}.csv')
+
+
+def counts_path(partition_dir: str, year: int) -> str:
+    """
+    Return the path of the file holding the partial counts of the partition of year.
+
+    >>> counts_path('partitions', 2003).replace(os.sep, '/')
+    'partitions/counts-2003.csv'
+    """
+    return os.path.join(partition_dir, f'counts-{year}.csv')
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'extra-imports': ['json', 'os', 'concurrent.futures', 'pandas', 'file_utils',
+                          'process_csv'],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200']
+    })
+
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
@@ -0,0 +1,148 @@
+"""
+A headless batch job that reports which (crime type, neighbourhood) cells have a p-index
+beyond a threshold in the latest month of data, written as JSON lines.
+
+Unlike main.py, this never imports plotly or dash and never starts the web app, so it is
+suitable to be run from cron. The processed CSV is read in chunks and only the rows needed to
+fit the model of the month being checked (that month of every fit year) and the month itself
+are kept, so memory does not grow with the history of the file. P-indexes are computed and
+emitted one cell at a time.
+
+Usage:
+    python pindex_alerts.py --path ./crime_data_vancouver.csv --fit-range 2014 2019
+"""
+import argparse
+import json
+import sys
+from typing import Iterator, Optional, TextIO
+import pandas as pd
+import time_axis
+from crime_data import CrimeData
+
+# number of rows of the processed CSV read at a time
+ALERT_CHUNKSIZE = 100000
+
+
+def scan_alerts(crime_data: CrimeData, fit_range: tuple[int, int],
+                year_month: tuple[int, int], threshold: float) -> Iterator[dict]:
+    """
+    Yield a record for every crime type and neighbourhood of crime_data whose p-index in
+    year_month has an absolute value strictly greater than threshold, in the order the cells are
+    computed.
+
+    Preconditions:
+        - fit_range[1] < year_month[0]
+        - 0 <= threshold < 100
+    """
+    year, month = year_month
+    for crime_type, neighbourhood, p_index in crime_data.iter_month_pindex(fit_range,
+                                                                            year_month):
+        if abs(p_index) > threshold:
+            yield {'crime_type': crime_type,
+                   'neighbourhood': neighbourhood,
+                   'year': year,
+                   'month': month,
+                   'p_index': round(float(p_index), 4)}
+
+
+def latest_year_month(path: str, chunksize: int = ALERT_CHUNKSIZE) -> tuple[int, int]:
+    """
+    Return the latest (year, month) that has data in the processed CSV at path, reading only
+    the year and month columns, chunksize rows at a time.
+
+    Only to be called using a file path that was built using the create_csv function.
+
+    Preconditions:
+        - chunksize >= 1
+    """
+    latest = -1
+    for chunk in pd.read_csv(path, usecols=['year', 'month'], chunksize=chunksize):
+        latest = max(latest, int(time_axis.month_index(chunk['year'].to_numpy(),
+                                                       chunk['month'].to_numpy()).max()))
+    year, month = time_axis.year_month(latest)
+    return int(year), int(month)
+
+
+def load_alert_data(path: str, fit_range: tuple[int, int], year_month: tuple[int, int],
+                    chunksize: int = ALERT_CHUNKSIZE) -> CrimeData:
+    """
+    Return the occurrences of the processed CSV at path that are needed to compute the p-indexes
+    of year_month: the month year_month[1] of every year of fit_range, and year_month itself.
+
+    The file is read chunksize rows at a time and the other rows are dropped as each chunk is
+    read, so at most one chunk and the kept rows are in memory at once.
+
+    Only to be called using a file path that was built using the create_csv function.
+
+    Preconditions:
+        - fit_range[0] <= fit_range[1] < year_month[0]
+        - chunksize >= 1
+
+    >>> import os, tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), 'processed.csv')
+    >>> pd.DataFrame({'crime_type': ['Theft'] * 4, 'neighbourhood': ['Sunset'] * 4, \
+    'year': [2018, 2018, 2019, 2020], 'month': [3, 4, 3, 3], \
+    'count': [5, 7, 6, 9]}).to_csv(path, index=False)
+    >>> data = load_alert_data(path, (2018, 2019), (2020, 3), chunksize=2)
+    >>> data.crime_occurrences['Theft']['Sunset'].occurrences
+    {2018: {3: 5}, 2019: {3: 6}, 2020: {3: 9}}
+    """
+    year, month = year_month
+    crime_data = CrimeData()
+
+    for chunk in pd.read_csv(path, usecols=['crime_type', 'neighbourhood', 'year', 'month',
+                                            'count'], chunksize=chunksize):
+        fit_rows = chunk['year'].between(*fit_range) & (chunk['month'] == month)
+        checked_rows = (chunk['year'] == year) & (chunk['month'] == month)
+        chunk = chunk[fit_rows | checked_rows]
+        for crime_type, neighbourhood, row_year, row_month, occurrences in zip(
+                chunk['crime_type'].tolist(), chunk['neighbourhood'].tolist(),
+                chunk['year'].tolist(), chunk['month'].tolist(), chunk['count'].tolist()):
+            crime_data.increment_crime((crime_type, neighbourhood, row_year, row_month),
+                                       occurrences)
+
+    return crime_data
+
+
+def run_alerts(path: str, fit_range: tuple[int, int], threshold: float, output: TextIO,
+               year_month: Optional[tuple[int, int]] = None) -> int:
+    """
+    Load the processed CSV at path, compute the p-indexes of year_month (the latest month in the
+    file if year_month is None) and write every threshold crossing to output as one JSON object
+    per line. Return the number of crossings written.
+
+    Only to be called using a file path that was built using the create_csv function.
+
+    Preconditions:
+        - fit_range[0] <= fit_range[1]
+        - 0 <= threshold < 100
+    """
+    if year_month is None:
+        year_month = latest_year_month(path)
+
+    crime_data = load_alert_data(path, fit_range, year_month)
+
+    crossings = 0
+    for record in scan_alerts(crime_data, fit_range, year_month, threshold):
+        output.write(json.dumps(record) + '\n')
+        crossings += 1
+    output.flush()
+
+    return crossings
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Report p-index threshold crossings for the '
+                                                 'latest month as JSON lines.')
+    parser.add_argument('--path', default='./crime_data_vancouver.csv',
+                        help='processed CSV built by process_csv.create_csv')
+    parser.add_argument('--fit-range', nargs=2, type=int, default=(2014, 2019),
+                        metavar=('START_YEAR', 'END_YEAR'),
+                        help='range of years used to fit the model')
+    parser.add_argument('--month', type=time_axis.parse_year_month, default=None,
+                        help="month to check as 'YYYY-MM' (defaults to the latest month)")
+    parser.add_argument('--threshold', type=float, default=95.0,
+                        help='report cells whose |p-index| is strictly greater than this')
+    args = parser.parse_args()
+
+    run_alerts(args.path, tuple(args.fit_range), args.threshold, sys.stdout, args.month)
@@ -4,8 +4,8 @@ from the Vancouver Police Department.
 
 Daniel Dervishi
 """
-import datetime
 import pandas as pd
+import time_axis
 from crime_data import CrimeData
 from neighbourhood_crime import NeighbourhoodCrimeOccurrences
 
@@ -20,8 +20,7 @@ def get_vancouver_data(path: str, start_year_month: tuple[int, int],
     Only to be called using a file path that was built using the create_csv function.
 
     Preconditions:
-        - datetime.date(year=start_year_month[0], month=start_year_month[1], day=1) < \
-        datetime.date(year=end_year_month[0], month=end_year_month[1], day=1)
+        - time_axis.month_index(*start_year_month) < time_axis.month_index(*end_year_month)
     """
     df = pd.read_csv(path)
     return dataframe_to_crime_data(df, (0, 1, 2, 3, 4), start_year_month, end_year_month)
@@ -47,8 +46,7 @@ def create_csv(raw_path: str, processed_path: str, necessary_columns: list,
     Preconditions:
         - raw_path == './pre-processed-crime-data-vancouver.csv'
         - necessary_columns == ['TYPE','NEIGHBOURHOOD', 'YEAR', 'MONTH']
-        - datetime.date(year=start_year_month[0], month=start_year_month[1], day=1) < \
-        datetime.date(year=end_year_month[0], month=end_year_month[1], day=1)
+        - time_axis.month_index(*start_year_month) < time_axis.month_index(*end_year_month)
 
     Code used to create 'crime_data_vancouver.csv'. CAUTION: This will cause crime_data_vancouver
     to be updated when running doctests.
@@ -64,8 +62,7 @@ def create_csv(raw_path: str, processed_path: str, necessary_columns: list,
     df.dropna(inplace=True)
 
     # count number occurrences for a given crimetype -> neighbourhood -> year -> month
-    df = df.value_counts().reset_index().rename(columns={0: 'COUNT'})
-    df = df.filter(items=['TYPE', 'NEIGHBOURHOOD', 'YEAR', 'MONTH', 'COUNT'])
+    df = count_occurrences(df)
 
     df = dataframe_to_crime_data(df, (0, 1, 2, 3, 4), start_year_month, end_year_month)
 
@@ -79,6 +76,28 @@ def create_csv(raw_path: str, processed_path: str, necessary_columns: list,
     df.to_csv(processed_path, index=False)
 
 
+def count_occurrences(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Counts the number of incidents in a dataframe of raw observations for each distinct
+    crime type, neighbourhood, year and month. The returned dataframe has the columns
+    'TYPE', 'NEIGHBOURHOOD', 'YEAR', 'MONTH' and 'COUNT' in that order.
+
+    Preconditions:
+        - list(df.columns) is a permutation of ['TYPE', 'NEIGHBOURHOOD', 'YEAR', 'MONTH']
+
+    >>> raw = pd.DataFrame({'TYPE': ['Mischief', 'Mischief', 'Homicide'], \
+    'YEAR': [2003, 2003, 2003], 'MONTH': [1, 1, 2], \
+    'NEIGHBOURHOOD': ['Sunset', 'Sunset', 'Fairview']})
+    >>> counts = count_occurrences(raw)
+    >>> list(counts.columns)
+    ['TYPE', 'NEIGHBOURHOOD', 'YEAR', 'MONTH', 'COUNT']
+    >>> sorted(counts['COUNT'])
+    [1, 2]
+    """
+    df = df.value_counts().reset_index(name='COUNT')
+    return df.filter(items=['TYPE', 'NEIGHBOURHOOD', 'YEAR', 'MONTH', 'COUNT'])
+
+
 def crime_data_to_dataframe(crime_data: CrimeData) -> pd.DataFrame:
     """
     Converts a CrimeData object to a pd.Dataframe object and removes observations with empty values.
@@ -115,8 +134,7 @@ def dataframe_to_crime_data(df: pd.DataFrame, observation: tuple[int, int, int,
     Preconditions:
         - len({observation[0], observation[1], observation[2], observation[3], \
         observation[4]}) == 5
-        - datetime.date(year=start_year_month[0], month=start_year_month[1], day=1) < \
-        datetime.date(year=end_year_month[0], month=end_year_month[1], day=1)
+        - time_axis.month_index(*start_year_month) < time_axis.month_index(*end_year_month)
     """
     col_num_crime_type = observation[0]
     col_num_neighbourhood = observation[1]
@@ -124,12 +142,19 @@ def dataframe_to_crime_data(df: pd.DataFrame, observation: tuple[int, int, int,
     col_num_month = observation[3]
     col_num_occurrences = observation[4]
 
+    # keep only the rows within the time frame, comparing month indexes of whole columns at once
+    in_range = time_axis.in_range_mask(
+        time_axis.month_index(df.iloc[:, col_num_year].to_numpy(),
+                              df.iloc[:, col_num_month].to_numpy()),
+        start_year_month, end_year_month)
+    df = df[in_range]
+
     crime_data = CrimeData()
-    for _, row in df.iterrows():
-        if date_in_range(start_year_month, end_year_month, (row[col_num_year], row[col_num_month])):
-            crime_data.increment_crime((row[col_num_crime_type], row[col_num_neighbourhood],
-                                       row[col_num_year], row[col_num_month]),
-                                       row[col_num_occurrences])
+    columns = [df.iloc[:, col_num].tolist() for col_num in (col_num_crime_type,
+                                                            col_num_neighbourhood, col_num_year,
+                                                            col_num_month, col_num_occurrences)]
+    for crime_type, neighbourhood, year, month, occurrences in zip(*columns):
+        crime_data.increment_crime((crime_type, neighbourhood, year, month), occurrences)
 
     return crime_data
 
@@ -139,8 +164,7 @@ def date_in_range(start_year_month: tuple[int, int],
     """Checks if a date is between start_year_month and end_year_month inclusive
 
     Preconditions:
-        - datetime.date(year=start_year_month[0], month=start_year_month[1], day=1) < \
-        datetime.date(year=end_year_month[0], month=end_year_month[1], day=1)
+        - time_axis.month_index(*start_year_month) < time_axis.month_index(*end_year_month)
 
     >>> date_in_range((2003,1), (2003,1), (2003, 1))
     True
@@ -151,10 +175,8 @@ def date_in_range(start_year_month: tuple[int, int],
     >>> date_in_range((2003,1), (2003, 11), (2003,2))
     True
     """
-    start = datetime.date(year=start_year_month[0], month=start_year_month[1], day=1)
-    end = datetime.date(year=end_year_month[0], month=end_year_month[1], day=1)
-    date = datetime.date(year=date_year_month[0], month=date_year_month[1], day=1)
-    return start <= date <= end
+    return bool(time_axis.in_range_mask(time_axis.month_index(*date_year_month),
+                                        start_year_month, end_year_month))
 
 
 def insert_non_nan(observation: tuple[str, str, int, int, int],
@@ -217,7 +239,8 @@ if __name__ == '__main__':
 
     import python_ta
     python_ta.check_all(config={
-        'extra-imports': ['datetime', 'crime_data', 'pandas', 'neighbourhood_crime'],
+        'extra-imports': ['crime_data', 'pandas', 'neighbourhood_crime',
+                          'time_axis'],
         'max-line-length': 100,
         'disable': ['R1705', 'C0200']
     })
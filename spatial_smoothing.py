@@ -0,0 +1,122 @@
+"""
+Functions to compute which neighbourhoods border each other from the boundary GeoJSON file,
+and to add a spatially smoothed p-index layer to a CrimeData object.
+
+Two neighbourhoods are adjacent when their boundaries share a segment, that is at least two
+vertices. The adjacency matrix is computed once per boundary file and cached on disk as a
+sparse matrix, keyed by the checksum of the boundary file and by the parameters it was built
+with.
+"""
+import itertools
+import os
+from scipy import sparse
+from crime_data import CrimeData
+from file_utils import file_checksum
+from neighbourhood_index import NeighbourhoodIndex, load_neighbourhood_index
+
+# number of decimals coordinates are rounded to before comparing vertices (about 0.1 m)
+VERTEX_PRECISION = 6
+
+
+def add_smoothed_layer(crime_data: CrimeData, fit_range: tuple[int, int],
+                       predict_range: tuple[int, int],
+                       geojson_path: str = 'local-area-boundary.geojson',
+                       cache_dir: str = '.cache') -> None:
+    """
+    Fill crime_data.crime_pindex_smoothed with the p-indexes of the occurrences of each
+    neighbourhood pooled with the occurrences of the neighbourhoods adjacent to it, using the
+    boundaries in geojson_path and the adjacency matrix cached in cache_dir.
+
+    Preconditions:
+        - fit_range[1] < predict_range[0]
+    """
+    index = load_neighbourhood_index(geojson_path)
+    region_ids = index.match({neighbourhood for crime in crime_data.crime_occurrences.values()
+                              for neighbourhood in crime})
+    adjacency = load_adjacency(index, geojson_path, cache_dir)
+    crime_data.create_smoothed_pindex_data(fit_range, predict_range, adjacency, region_ids)
+
+
+def load_adjacency(index: NeighbourhoodIndex, geojson_path: str, cache_dir: str,
+                   min_shared_vertices: int = 2) -> sparse.csr_matrix:
+    """
+    Return the adjacency matrix of the neighbourhoods of index, built from the boundary file at
+    geojson_path by build_adjacency with min_shared_vertices. The matrix is read from cache_dir
+    if it was already computed for a boundary file with the same contents, VERTEX_PRECISION
+    and min_shared_vertices, and computed and written to cache_dir otherwise.
+
+    Preconditions:
+        - min_shared_vertices >= 1
+    """
+    cache_path = os.path.join(cache_dir, f'adjacency-{file_checksum(geojson_path)[:16]}'
+                                         f'-p{VERTEX_PRECISION}-v{min_shared_vertices}.npz')
+    if os.path.exists(cache_path):
+        return sparse.load_npz(cache_path).tocsr()
+
+    adjacency = build_adjacency(index.geojson, min_shared_vertices)
+    os.makedirs(cache_dir, exist_ok=True)
+    sparse.save_npz(cache_path, adjacency)
+    return adjacency
+
+
+def build_adjacency(geojson: dict, min_shared_vertices: int = 2) -> sparse.csr_matrix:
+    """
+    Return the symmetric (features x features) adjacency matrix of the features of geojson, in
+    the order of the features, where two features are adjacent if their boundaries share at
+    least min_shared_vertices vertices. The diagonal is zero.
+
+    Preconditions:
+        - min_shared_vertices >= 1
+
+    >>> square = [[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]
+    >>> features = [{'geometry': {'type': 'Polygon', 'coordinates': [ \
+    [[x + offset, y] for x, y in square]]}} for offset in (0, 1, 3)]
+    >>> build_adjacency({'features': features}).toarray().tolist()
+    [[0.0, 1.0, 0.0], [1.0, 0.0, 0.0], [0.0, 0.0, 0.0]]
+    """
+    vertices = [polygon_vertices(feature['geometry']) for feature in geojson['features']]
+
+    rows, columns = [], []
+    for first, second in itertools.combinations(range(len(vertices)), 2):
+        if len(vertices[first] & vertices[second]) >= min_shared_vertices:
+            rows.extend([first, second])
+            columns.extend([second, first])
+
+    return sparse.csr_matrix(([1.0] * len(rows), (rows, columns)),
+                             shape=(len(vertices), len(vertices)))
+
+
+def polygon_vertices(geometry: dict) -> set[tuple[float, float]]:
+    """
+    Return the set of the vertices of a GeoJSON Polygon or MultiPolygon geometry, rounded to
+    VERTEX_PRECISION decimals.
+
+    >>> sorted(polygon_vertices({'type': 'Polygon', \
+    'coordinates': [[[0, 0], [1.0000001, 0], [0, 1], [0, 0]]]}))
+    [(0, 0), (0, 1), (1.0, 0)]
+    """
+    if geometry['type'] == 'MultiPolygon':
+        polygons = geometry['coordinates']
+    else:
+        polygons = [geometry['coordinates']]
+
+    return {(round(x, VERTEX_PRECISION), round(y, VERTEX_PRECISION))
+            for polygon in polygons for ring in polygon for x, y in ring}
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'extra-imports': ['itertools', 'os', 'scipy', 'crime_data', 'file_utils',
+                          'neighbourhood_index'],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200']
+    })
+
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
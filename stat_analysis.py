@@ -5,6 +5,8 @@ to generate p-index values.
 Martin Calcaterra, Daniel Dervishi
 """
 import math
+import numpy as np
+from scipy.special import erf
 from sklearn.linear_model import LinearRegression
 
 
@@ -146,13 +148,174 @@ def gen_pindex(p: float, overestimated: bool) -> float:
     return pindex
 
 
+def gen_pindex_array(observations: np.ndarray, predictions: np.ndarray,
+                     standard_deviations: np.ndarray) -> np.ndarray:
+    """
+    Vectorized version of gen_z, gen_p and gen_pindex: return the p-index of every
+    observation given the matching prediction and standard deviation. The three arrays are
+    broadcast against each other.
+
+    Missing (NaN) observations or predictions give a NaN p-index.
+
+    Preconditions:
+        - np.all(standard_deviations >= 0)
+
+    >>> pindexes = gen_pindex_array(np.array([5.0, 998.9]), np.array([3.0, 1000.0]), \
+    np.array([1.0, 5.0]))
+    >>> expected = [gen_pindex(gen_p(gen_z(5.0, 3.0, 1.0)[0]), False), \
+    gen_pindex(gen_p(gen_z(998.9, 1000.0, 5.0)[0]), True)]
+    >>> np.allclose(pindexes, expected)
+    True
+    """
+    deviations = observations - predictions
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = np.where(standard_deviations > 0, np.abs(deviations) / standard_deviations, 0.0)
+
+    # 1 - p, where p is computed in the same way as in gen_p
+    pindexes = erf(z / (2 ** (1 / 2))) * 100
+    pindexes = np.where(observations < predictions, -pindexes, pindexes)
+    return np.where(np.isnan(deviations), np.nan, pindexes)
+
+
+def gen_batch_linear_regression(years: np.ndarray, occurrences: np.ndarray) \
+        -> tuple[np.ndarray, np.ndarray]:
+    """
+    Fit a least squares line to every row of occurrences at once, where years holds the x
+    values shared by all rows. Return the slopes and the intercepts, one per row (the same
+    model as gen_linear_regression).
+
+    Preconditions:
+        - years.ndim == 1 and len(set(years)) > 1
+        - occurrences.shape[-1] == len(years)
+
+    >>> slopes, intercepts = gen_batch_linear_regression(np.array([2003, 2004, 2005]), \
+    np.array([[1.0, 2.0, 3.0], [4.0, 4.0, 4.0]]))
+    >>> np.allclose(slopes, [1.0, 0.0]) and np.allclose(intercepts, [-2002.0, 4.0])
+    True
+    """
+    mean_year = years.mean()
+    centred_years = years - mean_year
+    mean_occurrences = occurrences.mean(axis=-1)
+
+    slopes = (occurrences @ centred_years) / (centred_years @ centred_years)
+    intercepts = mean_occurrences - slopes * mean_year
+    return slopes, intercepts
+
+
+def gen_masked_linear_regression(years: np.ndarray, occurrences: np.ndarray) \
+        -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Fit a least squares line to every row of occurrences at once, leaving the missing (NaN)
+    occurrences of each row out of its fit, where years holds the x values shared by all rows.
+    Return the slopes, the intercepts and the RMSDs, one per row (the same model as
+    gen_linear_regression and gen_rmsd on the years of the row that have data).
+
+    A row with data for a single year gets a flat line through it, and a row without data gets
+    NaN for all three.
+
+    Preconditions:
+        - years.ndim == 1
+        - occurrences.shape[-1] == len(years)
+
+    >>> slopes, intercepts, rmsd = gen_masked_linear_regression(np.array([2003, 2004, 2005]), \
+    np.array([[1.0, np.nan, 3.0], [4.0, 5.0, 4.0], [np.nan, 7.0, np.nan]]))
+    >>> np.allclose(slopes, [1.0, 0.0, 0.0]) and np.allclose(intercepts, [-2002.0, 13 / 3, 7.0])
+    True
+    >>> np.allclose(rmsd, [0.0, (2 / 9) ** 0.5, 0.0])
+    True
+    """
+    valid = ~np.isnan(occurrences)
+    counts = valid.sum(axis=-1)
+    values = np.where(valid, occurrences, 0.0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_years = (valid * years).sum(axis=-1) / counts
+        mean_occurrences = values.sum(axis=-1) / counts
+        centred_years = np.where(valid, years - mean_years[..., np.newaxis], 0.0)
+        variances = (centred_years ** 2).sum(axis=-1)
+        slopes = np.where(variances > 0,
+                          (centred_years * values).sum(axis=-1) / variances,
+                          np.where(counts > 0, 0.0, np.nan))
+        intercepts = mean_occurrences - slopes * mean_years
+
+        residuals = np.where(valid, occurrences - intercepts[..., np.newaxis]
+                             - slopes[..., np.newaxis] * years, 0.0)
+        rmsd = np.sqrt((residuals ** 2).sum(axis=-1) / counts)
+
+    return slopes, intercepts, rmsd
+
+
+def gen_bootstrap_pindex_bounds(fit_data: tuple[np.ndarray, np.ndarray],
+                                predict_data: tuple[np.ndarray, np.ndarray],
+                                n_resamples: int, confidence: float,
+                                seed: tuple[int, ...]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Return the lower and upper bounds of a confidence interval for the p-index of every
+    predicted observation of a batch of series, using a residual bootstrap of the linear model.
+
+    For every series, the residuals of the fit are resampled with replacement n_resamples times,
+    the model is refit to the fitted values plus the resampled residuals and the p-index of each
+    observation is recomputed. All series and all resamples are computed as batched array
+    operations. The resampling is seeded with seed, so the same inputs always give the same
+    bounds.
+
+    Parameters:
+        - fit_data: the years used to make the model (shape (F,)) and the occurrences in those
+        years for every series (shape (S, F)).
+        - predict_data: the years to make predictions for (shape (P,)) and the observed
+        occurrences in those years for every series (shape (S, P)). Missing observations are
+        NaN and get NaN bounds.
+        - confidence: the probability covered by the interval.
+
+    Preconditions:
+        - n_resamples >= 1
+        - 0 < confidence < 1
+
+    >>> lower, upper = gen_bootstrap_pindex_bounds( \
+    (np.arange(2014, 2020), np.array([[10.0, 12.0, 9.0, 14.0, 12.0, 15.0]])), \
+    (np.array([2020]), np.array([[30.0]])), 500, 0.9, (0,))
+    >>> bool(lower[0, 0] <= upper[0, 0])
+    True
+    """
+    fit_years, fit_occurrences = fit_data
+    predict_years, predict_occurrences = predict_data
+    rng = np.random.default_rng(seed)
+
+    slopes, intercepts = gen_batch_linear_regression(fit_years, fit_occurrences)
+    fitted = intercepts[:, np.newaxis] + slopes[:, np.newaxis] * fit_years
+    residuals = fit_occurrences - fitted
+
+    # resample the residuals of each series with replacement: shape (n_resamples, S, F)
+    n_series, n_fit = fit_occurrences.shape
+    choices = rng.integers(0, n_fit, size=(n_resamples, n_series, n_fit))
+    resampled = fitted + np.take_along_axis(residuals[np.newaxis], choices, axis=-1)
+
+    # refit every resample of every series at once
+    resampled_slopes, resampled_intercepts = gen_batch_linear_regression(fit_years, resampled)
+    resampled_fitted = resampled_intercepts[..., np.newaxis] \
+        + resampled_slopes[..., np.newaxis] * fit_years
+    rmsd = np.sqrt(np.mean((resampled - resampled_fitted) ** 2, axis=-1))
+    predictions = resampled_intercepts[..., np.newaxis] \
+        + resampled_slopes[..., np.newaxis] * predict_years
+
+    pindexes = gen_pindex_array(predict_occurrences[np.newaxis], predictions,
+                                rmsd[..., np.newaxis])
+
+    tail = (1 - confidence) / 2 * 100
+    lower, upper = np.percentile(pindexes, [tail, 100 - tail], axis=0)
+
+    missing = np.isnan(predict_occurrences)
+    return np.where(missing, np.nan, lower), np.where(missing, np.nan, upper)
+
+
 if __name__ == '__main__':
     import doctest
     doctest.testmod()
 
     import python_ta
     python_ta.check_all(config={
-        'extra-imports': ['neighbourhood_crime', 'sklearn.linear_model', 'math'],
+        'extra-imports': ['neighbourhood_crime', 'sklearn.linear_model', 'math', 'numpy',
+                          'scipy.special'],
         'max-line-length': 100,
         'disable': ['R1705', 'C0200']
     })
@@ -0,0 +1,251 @@
+"""
+A synthetic workload generator and a stress test of the full pipeline.
+
+generate_synthetic_csv writes a CSV in exactly the schema of crime_data_vancouver.csv, with a
+configurable number of neighbourhoods, crime types and years, and monthly counts drawn from a
+Poisson distribution around a rate with a yearly seasonal cycle and a trend.
+
+run_stress_test generates workloads of increasing size along each axis (the number of
+neighbourhoods, the number of crime types and the number of years of history, one at a time)
+and measures the time and the peak memory of get_vancouver_data, create_pindex_data and
+unpack_data on each of them. Time is measured in a run of the pipeline without tracing, and
+peak memory in a separate run traced by tracemalloc, so the overhead of tracing does not
+inflate the times. The growth of each stage with the number of rows is estimated as the
+exponent of a power law, and stages that grow faster than linearly along an axis are flagged.
+
+Usage:
+    python stress_test.py --neighbourhoods 24 --crime-types 11 --years 2003 2021 --steps 4
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import Callable
+import numpy as np
+import pandas as pd
+import heatmap_generation
+import process_csv
+
+# growth exponents (time or peak memory against rows) above this are flagged as superlinear
+SUPERLINEAR_EXPONENT = 1.15
+
+STAGES = ('get_vancouver_data', 'create_pindex_data', 'unpack_data')
+
+# the dimensions of a workload that are grown, one at a time
+AXES = ('neighbourhoods', 'crime_types', 'years')
+
+
+def generate_synthetic_csv(path: str, n_neighbourhoods: int, n_crime_types: int,
+                           years: tuple[int, int], mean_count: float = 20.0,
+                           seasonal_amplitude: float = 0.3, yearly_trend: float = 0.02,
+                           seed: int = 0) -> int:
+    """
+    Write a synthetic processed CSV to path with the columns crime_type, neighbourhood, year,
+    month and count (the schema of crime_data_vancouver.csv) and return its number of rows.
+
+    Every crime type and neighbourhood has a row for every month of years[0] to years[1]
+    inclusive. Its counts are Poisson distributed around a base rate (log-normally distributed
+    around mean_count across crime types and neighbourhoods), multiplied by a yearly seasonal
+    cycle of relative amplitude seasonal_amplitude with a random phase, and by a trend of
+    yearly_trend relative growth per year.
+
+    Preconditions:
+        - n_neighbourhoods >= 1
+        - n_crime_types >= 1
+        - years[0] <= years[1]
+        - mean_count > 0
+        - 0 <= seasonal_amplitude < 1
+
+    >>> path = os.path.join(tempfile.mkdtemp(), 'synthetic.csv')
+    >>> generate_synthetic_csv(path, 3, 2, (2003, 2004))
+    144
+    >>> list(pd.read_csv(path).columns)
+    ['crime_type', 'neighbourhood', 'year', 'month', 'count']
+    """
+    rng = np.random.default_rng(seed)
+    n_series = n_crime_types * n_neighbourhoods
+    n_years = years[1] - years[0] + 1
+
+    # rate of every series, year and month: shape (series, years, 12)
+    base_rates = mean_count * rng.lognormal(mean=-0.5, sigma=1.0, size=n_series)
+    phases = rng.uniform(0, 2 * np.pi, size=n_series)
+    seasons = 1 + seasonal_amplitude * np.sin(
+        2 * np.pi * np.arange(12) / 12 + phases[:, np.newaxis])
+    trends = (1 + yearly_trend) ** np.arange(n_years)
+    rates = base_rates[:, np.newaxis, np.newaxis] * trends[:, np.newaxis] \
+        * seasons[:, np.newaxis, :]
+    counts = rng.poisson(rates)
+
+    crime_types = [f'Crime Type {number}' for number in range(1, n_crime_types + 1)]
+    neighbourhoods = [f'Neighbourhood {number}' for number in range(1, n_neighbourhoods + 1)]
+    rows_per_series = n_years * 12
+    df = pd.DataFrame({
+        'crime_type': np.repeat(crime_types, n_neighbourhoods * rows_per_series),
+        'neighbourhood': np.tile(np.repeat(neighbourhoods, rows_per_series), n_crime_types),
+        'year': np.tile(np.repeat(np.arange(years[0], years[1] + 1), 12), n_series),
+        'month': np.tile(np.arange(1, 12 + 1), n_series * n_years),
+        'count': counts.reshape(-1)})
+    df.to_csv(path, index=False)
+
+    return len(df)
+
+
+def time_stage(stage: Callable[[], object]) -> tuple[object, float]:
+    """
+    Run stage and return its result and the time it took in seconds.
+    """
+    start = time.perf_counter()
+    result = stage()
+    return result, time.perf_counter() - start
+
+
+def trace_stage(stage: Callable[[], object]) -> tuple[object, float]:
+    """
+    Run stage while tracing memory allocations with tracemalloc and return its result and the
+    peak memory it allocated in bytes.
+
+    Preconditions:
+        - not tracemalloc.is_tracing()
+
+    >>> _, peak = trace_stage(lambda: bytearray(10 ** 6))
+    >>> peak >= 10 ** 6
+    True
+    """
+    tracemalloc.start()
+    try:
+        result = stage()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, float(peak)
+
+
+def run_stages(path: str, years: tuple[int, int],
+               measure: Callable[[Callable[[], object]], tuple[object, float]]) -> list[float]:
+    """
+    Run the pipeline on the synthetic CSV at path, covering years[0] to years[1], and return the
+    measurement of each of STAGES, taken by measure (time_stage or trace_stage).
+
+    The model is fit on the six years before the last two years, which are predicted.
+
+    Preconditions:
+        - years[1] - years[0] + 1 >= 8
+    """
+    fit_range = (years[1] - 7, years[1] - 2)
+    predict_range = (years[1] - 1, years[1])
+
+    data, loading = measure(lambda: process_csv.get_vancouver_data(
+        path, start_year_month=(years[0], 1), end_year_month=(years[1], 12)))
+    _, fitting = measure(lambda: data.create_pindex_data(fit_range, predict_range))
+    _, unpacking = measure(lambda: heatmap_generation.unpack_data(data))
+    return [loading, fitting, unpacking]
+
+
+def run_stress_test(n_neighbourhoods: int, n_crime_types: int, years: tuple[int, int],
+                    steps: int, growth: int = 2, axes: tuple[str, ...] = AXES) -> pd.DataFrame:
+    """
+    Run the pipeline on synthetic workloads of increasing size and return one row per axis,
+    workload and stage with the columns axis, stage, neighbourhoods, crime_types, years, rows,
+    seconds and peak_bytes.
+
+    The first workload has n_neighbourhoods neighbourhoods, n_crime_types crime types and the
+    years years[0] to years[1]. For every axis of axes, each of the steps workloads has growth
+    times as many neighbourhoods, crime types or years of history (ending in years[1]) as the
+    previous one, the other two dimensions staying those of the first workload.
+
+    Every workload is run twice: once without tracing to measure the time of each stage, and
+    once with tracemalloc to measure the peak memory of each stage.
+
+    Preconditions:
+        - n_neighbourhoods >= 1
+        - n_crime_types >= 1
+        - years[1] - years[0] + 1 >= 8
+        - steps >= 2
+        - growth >= 2
+        - all(axis in AXES for axis in axes)
+    """
+    records = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'synthetic.csv')
+        for axis in axes:
+            for step in range(steps):
+                size = {'neighbourhoods': n_neighbourhoods, 'crime_types': n_crime_types,
+                        'years': years[1] - years[0] + 1}
+                size[axis] *= growth ** step
+                workload_years = (years[1] - size['years'] + 1, years[1])
+                rows = generate_synthetic_csv(path, size['neighbourhoods'], size['crime_types'],
+                                              workload_years, seed=step)
+
+                seconds = run_stages(path, workload_years, time_stage)
+                peaks = run_stages(path, workload_years, trace_stage)
+                for stage, stage_seconds, peak in zip(STAGES, seconds, peaks):
+                    records.append((axis, stage, size['neighbourhoods'], size['crime_types'],
+                                    size['years'], rows, stage_seconds, int(peak)))
+
+    return pd.DataFrame(records, columns=['axis', 'stage', 'neighbourhoods', 'crime_types',
+                                          'years', 'rows', 'seconds', 'peak_bytes'])
+
+
+def growth_exponents(results: pd.DataFrame) -> pd.DataFrame:
+    """
+    Return, for every axis and stage of results (a dataframe returned by run_stress_test), the
+    exponent k of the power law rows ** k that best fits the growth of its time and of its peak
+    memory along the axis, and whether either exponent is above SUPERLINEAR_EXPONENT.
+
+    >>> results = pd.DataFrame({'axis': ['years'] * 6, 'stage': ['a'] * 3 + ['b'] * 3, \
+    'rows': [10, 20, 40] * 2, 'seconds': [1.0, 2.0, 4.0, 1.0, 4.0, 16.0], \
+    'peak_bytes': [5, 10, 20] * 2})
+    >>> exponents = growth_exponents(results)
+    >>> [round(value, 2) for value in exponents['time_exponent']]
+    [1.0, 2.0]
+    >>> exponents['superlinear'].tolist()
+    [False, True]
+    """
+    summary = []
+    for (axis, stage), group in results.groupby(['axis', 'stage'], sort=False):
+        log_rows = np.log(group['rows'].to_numpy(dtype=float))
+        time_exponent = np.polyfit(log_rows, np.log(group['seconds'].to_numpy(dtype=float)),
+                                   1)[0]
+        memory_exponent = np.polyfit(
+            log_rows, np.log(np.maximum(group['peak_bytes'].to_numpy(dtype=float), 1.0)), 1)[0]
+        summary.append((axis, stage, float(time_exponent), float(memory_exponent),
+                        bool(max(time_exponent, memory_exponent) > SUPERLINEAR_EXPONENT)))
+
+    return pd.DataFrame(summary, columns=['axis', 'stage', 'time_exponent', 'memory_exponent',
+                                          'superlinear'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure how the pipeline scales on synthetic '
+                                                 'workloads of increasing size.')
+    parser.add_argument('--neighbourhoods', type=int, default=24,
+                        help='number of neighbourhoods of the smallest workload')
+    parser.add_argument('--crime-types', type=int, default=11, help='number of crime types')
+    parser.add_argument('--years', nargs=2, type=int, default=(2003, 2021),
+                        metavar=('START_YEAR', 'END_YEAR'), help='years of history')
+    parser.add_argument('--steps', type=int, default=4, help='number of workloads')
+    parser.add_argument('--growth', type=int, default=2,
+                        help='factor by which the grown axis grows between workloads')
+    parser.add_argument('--axes', nargs='+', choices=AXES, default=list(AXES),
+                        help='dimensions of the workload to grow, one at a time')
+    parser.add_argument('--generate', default=None, metavar='PATH',
+                        help='only write the smallest workload to PATH and exit')
+    args = parser.parse_args()
+
+    if args.generate is not None:
+        generate_synthetic_csv(args.generate, args.neighbourhoods, args.crime_types,
+                               tuple(args.years))
+    else:
+        stress_results = run_stress_test(args.neighbourhoods, args.crime_types,
+                                         tuple(args.years), args.steps, args.growth,
+                                         tuple(args.axes))
+        print(stress_results.to_string(index=False))
+        print()
+        exponents_summary = growth_exponents(stress_results)
+        print(exponents_summary.to_string(index=False))
+        flagged = exponents_summary[exponents_summary['superlinear']]
+        for flagged_axis, flagged_stage in zip(flagged['axis'], flagged['stage']):
+            print(f'WARNING: {flagged_stage} grows faster than linearly with the number of rows '
+                  f"when the {flagged_axis.replace('_', ' ')} grow")
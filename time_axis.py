@@ -0,0 +1,120 @@
+"""
+A time axis of months represented by a single integer month index, year * 12 + month - 1.
+
+Month indexes are consecutive integers, so the month after a month is its index plus one,
+ranges of months are integer ranges and checking whether a month lies in a range is an
+integer comparison. Every function accepts either plain ints or NumPy arrays of them, so
+whole columns of years and months can be converted and checked at once.
+"""
+from typing import Union
+import numpy as np
+
+MONTH_NAMES = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+IntOrArray = Union[int, np.ndarray]
+
+
+def month_index(year: IntOrArray, month: IntOrArray) -> IntOrArray:
+    """Return the month index of the given year and month (months are indexed starting at 1).
+
+    Preconditions:
+        - np.all(1 <= np.asarray(month)) and np.all(np.asarray(month) <= 12)
+
+    >>> month_index(2003, 1)
+    24036
+    >>> month_index(2003, 12) + 1 == month_index(2004, 1)
+    True
+    >>> month_index(np.array([2003, 2021]), np.array([1, 11])).tolist()
+    [24036, 24262]
+    """
+    return year * 12 + month - 1
+
+
+def year_month(index: IntOrArray) -> tuple[IntOrArray, IntOrArray]:
+    """Return the year and the month (starting at 1) of a month index.
+
+    >>> year_month(24262)
+    (2021, 11)
+    >>> years, months = year_month(np.array([24036, 24047]))
+    >>> years.tolist(), months.tolist()
+    ([2003, 2003], [1, 12])
+    """
+    year, month = divmod(index, 12)
+    return year, month + 1
+
+
+def month_range(start_year_month: tuple[int, int], end_year_month: tuple[int, int]) -> np.ndarray:
+    """Return the month indexes from start_year_month to end_year_month inclusive, in order.
+
+    >>> [year_month(int(index)) for index in month_range((2003, 11), (2004, 2))]
+    [(2003, 11), (2003, 12), (2004, 1), (2004, 2)]
+    """
+    return np.arange(month_index(*start_year_month), month_index(*end_year_month) + 1)
+
+
+def in_range_mask(index: IntOrArray, start_year_month: tuple[int, int],
+                  end_year_month: tuple[int, int]) -> Union[bool, np.ndarray]:
+    """Return whether each month index lies between start_year_month and end_year_month
+    inclusive.
+
+    >>> in_range_mask(np.array([24035, 24036, 24047, 24048]), (2003, 1), (2003, 12)).tolist()
+    [False, True, True, False]
+    """
+    return (month_index(*start_year_month) <= index) & (index <= month_index(*end_year_month))
+
+
+def month_label(index: int) -> str:
+    """Return the label of a month index in the form 'month year'.
+
+    >>> month_label(month_index(2021, 10))
+    'Oct 2021'
+    """
+    year, month = year_month(index)
+    return f'{MONTH_NAMES[month - 1]} {year}'
+
+
+def month_labels(index: np.ndarray) -> list[str]:
+    """Return the label of every month index in index, computing each distinct label once.
+
+    >>> month_labels(np.array([24261, 24262, 24261]))
+    ['Oct 2021', 'Nov 2021', 'Oct 2021']
+    """
+    unique, inverse = np.unique(index, return_inverse=True)
+    labels = [month_label(int(value)) for value in unique]
+    return [labels[position] for position in inverse.reshape(-1)]
+
+
+def parse_year_month(text: str) -> tuple[int, int]:
+    """Parse a year and month written as 'YYYY-MM'.
+
+    Raise a ValueError if text is not of this form or the month is not between 1 and 12.
+
+    >>> parse_year_month('2021-11')
+    (2021, 11)
+    >>> parse_year_month('2021-13')
+    Traceback (most recent call last):
+    ...
+    ValueError: month must be between 1 and 12, not 13
+    """
+    year, month = text.split('-')
+    year, month = int(year), int(month)
+    if not 1 <= month <= 12:
+        raise ValueError(f'month must be between 1 and 12, not {month}')
+    return year, month
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'extra-imports': ['typing', 'numpy'],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200']
+    })
+
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()